@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# benchmark.py
+# Timing of readmdict.py on synthetic dictionaries written by mdictgen.py
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+
+"""
+Time opening, iterating and extracting synthetic MDX/MDD files, and the peak
+memory of iterating and extracting them, then print the results and optionally
+write them as JSON, to compare against the results of another commit:
+
+    $ python benchmark.py -n 100000 -o before.json
+    $ git checkout other-branch
+    $ python benchmark.py -n 100000 -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from mdictgen import write_mdx, write_mdd, synthetic_entries, synthetic_resources, \
+    synthetic_styled_entries, synthetic_stylesheet
+from readmdict import MDX, MDD
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def best_of(repeat, func):
+    """
+    return the best wall time of repeat calls of func
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_open(fname, repeat, cls=MDX):
+    return best_of(repeat, lambda: cls(fname))
+
+
+def bench_items(fname, repeat, cls=MDX):
+    mdict = cls(fname)
+    return best_of(repeat, lambda: sum(1 for item in mdict.items()))
+
+
+def bench_substyle(fname, num_entries, markers, repeat):
+    """
+    time items() with style substitution of num_entries records holding
+    markers style markers each
+    """
+    write_mdx(fname, synthetic_styled_entries(num_entries, markers), stylesheet=synthetic_stylesheet(20))
+    mdx = MDX(fname, substyle=True)
+    return best_of(repeat, lambda: sum(1 for item in mdx.items()))
+
+
+# runs a script or -c code, then reports its own peak RSS: the usage of a
+# child process seen by its parent may include the parent's memory at fork time
+_PEAK_RSS_WRAPPER = """
+import runpy, sys
+sys.argv = sys.argv[1:]
+if sys.argv[0] == '-c':
+    del sys.argv[0]
+    exec(sys.argv[0])
+else:
+    sys.path.insert(0, '')
+    runpy.run_path(sys.argv[0], run_name='__main__')
+sys.stdout.flush()
+try:
+    with open('/proc/self/status') as f:
+        peak = [int(line.split()[1]) for line in f if line.startswith('VmHWM:')][0] * 1024
+except (IOError, OSError):
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak *= 1 if sys.platform == 'darwin' else 1024
+sys.stdout.write('\\npeak_rss %d\\n' % peak)
+"""
+
+
+def run_child(args):
+    """
+    run a python process with args, return its wall time and peak RSS in MB
+    """
+    start = time.time()
+    process = subprocess.Popen([sys.executable, '-c', _PEAK_RSS_WRAPPER] + args, cwd=_HERE,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    elapsed = time.time() - start
+    if process.returncode:
+        raise RuntimeError('%s failed:\n%s' % (' '.join(args), output.decode('utf-8', 'replace')))
+    peak_rss = int(output.split()[-1])
+    return elapsed, peak_rss / 1e6
+
+
+def bench_extract(fname):
+    """
+    time readmdict.py -x on fname and its companion MDD
+    """
+    return run_child([os.path.join(_HERE, 'readmdict.py'), '-x', fname])
+
+
+def bench_items_rss(fname):
+    """
+    peak RSS of a process opening fname and iterating over all its items
+    """
+    code = 'from readmdict import MDX; sum(1 for item in MDX(sys.argv[1]).items())'
+    return run_child(['-c', code, fname])[1]
+
+
+def load_test(host, port, paths, concurrency=16, num_requests=10000):
+    """
+    request paths round robin over concurrency keep-alive connections,
+    return (requests per second, p50 latency, p99 latency)
+    """
+    import asyncio
+
+    latencies = []
+
+    async def client(paths):
+        reader, writer = await asyncio.open_connection(host, port)
+        for path in paths:
+            start = time.time()
+            writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\n\r\n' % (path, host)).encode('latin-1'))
+            await writer.drain()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line == b'\r\n':
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+            latencies.append(time.time() - start)
+        writer.close()
+
+    async def run():
+        requests = [paths[i % len(paths)] for i in range(num_requests)]
+        await asyncio.gather(*[client(requests[i::concurrency]) for i in range(concurrency)])
+
+    start = time.time()
+    asyncio.run(run())
+    elapsed = time.time() - start
+    latencies.sort()
+    return (len(latencies) / elapsed, latencies[len(latencies) // 2],
+            latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)])
+
+
+def bench_server(fname, concurrency, num_requests):
+    """
+    serve fname from a background thread and load test its /entry/ urls
+    """
+    import asyncio
+    from urllib.parse import quote
+    from mdxserver import open_server
+
+    server = open_server(fname)
+    address = []
+    ready = threading.Event()
+
+    def listening(bound):
+        address.extend(bound)
+        ready.set()
+
+    thread = threading.Thread(target=lambda: asyncio.run(server.serve('127.0.0.1', 0, listening)))
+    thread.daemon = True
+    thread.start()
+    ready.wait()
+    keys = list(server.mdx.keys())
+    rand = random.Random(0)
+    paths = ['/entry/' + quote(rand.choice(keys)) for i in range(1000)]
+    return load_test(address[0], address[1], paths, concurrency, num_requests)
+
+
+def git_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=_HERE,
+                                         stderr=subprocess.STDOUT)
+        return output.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, old_results):
+    """
+    print each result next to the one of old_results and their ratio
+    """
+    print('compared to %s:' % (old_results.get('commit') or 'previous run'))
+    if old_results.get('config') != results['config']:
+        print('  warning: the configurations differ')
+    for name, value in sorted(results['results'].items()):
+        old_value = old_results['results'].get(name)
+        if value is None or not old_value:
+            continue
+        print('  %-24s %10.3f -> %10.3f  (%+.1f%%)' % (name, old_value, value,
+                                                   (value / old_value - 1) * 100))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--entries', default=1000000, type=int,
+                        help='number of entries of the synthetic dictionary')
+    parser.add_argument('-m', '--resources', default=1000, type=int,
+                        help='number of files of the synthetic resource file, 0 for none')
+    parser.add_argument('-e', '--encoding', default='UTF-8',
+                        help='encoding of the synthetic dictionary: UTF-8, UTF-16 or GB18030')
+    parser.add_argument('-v', '--version', default='2.0', choices=['1.2', '2.0'],
+                        help='engine version of the synthetic files')
+    parser.add_argument('-z', '--compression', default=2, type=int, choices=[0, 1, 2],
+                        help='block compression: 0 none, 1 LZO, 2 zlib')
+    parser.add_argument('--encrypted', action='store_true',
+                        help='encrypt the key block info (Encrypted="2")')
+    parser.add_argument('-b', '--block-size', default=16384, type=int,
+                        help='minimum size of mdx record blocks')
+    parser.add_argument('-k', '--key-block-size', default=None, type=int,
+                        help='minimum size of key blocks, default the record block size')
+    parser.add_argument('--style-markers', default=300, type=int,
+                        help='style markers per record of the 1000 entries substyle run, 0 for none')
+    parser.add_argument('-r', '--repeat', default=3, type=int,
+                        help='number of runs, the best is reported')
+    parser.add_argument('--serve', action='store_true',
+                        help='also load test readmdict.py serve')
+    parser.add_argument('-c', '--concurrency', default=16, type=int,
+                        help='number of connections of the load test')
+    parser.add_argument('--requests', default=10000, type=int,
+                        help='number of requests of the load test')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of previous results to compare with')
+    args = parser.parse_args()
+
+    config = {
+        'entries': args.entries,
+        'resources': args.resources,
+        'encoding': args.encoding,
+        'version': args.version,
+        'compression': args.compression,
+        'encrypted': 2 if args.encrypted else 0,
+        'block_size': args.block_size,
+        'key_block_size': args.key_block_size,
+        'style_markers': args.style_markers,
+    }
+    options = dict(version=args.version, compression=args.compression,
+                   encrypted=config['encrypted'], key_block_size=args.key_block_size)
+    results = {}
+
+    folder = tempfile.mkdtemp()
+    fname = os.path.join(folder, 'synthetic.mdx')
+    mdd_fname = os.path.join(folder, 'synthetic.mdd')
+    try:
+        write_mdx(fname, synthetic_entries(args.entries), args.encoding, args.block_size, **options)
+        results['mdx_open_s'] = bench_open(fname, args.repeat)
+        results['mdx_items_s'] = bench_items(fname, args.repeat)
+        results['mdx_items_peak_rss_mb'] = bench_items_rss(fname)
+        if args.resources:
+            write_mdd(mdd_fname, synthetic_resources(args.resources), **options)
+            results['mdd_open_s'] = bench_open(mdd_fname, args.repeat, MDD)
+            results['mdd_items_s'] = bench_items(mdd_fname, args.repeat, MDD)
+        results['extract_s'], results['extract_peak_rss_mb'] = bench_extract(fname)
+        if args.style_markers:
+            results['mdx_items_substyle_s'] = bench_substyle(os.path.join(folder, 'styled.mdx'), 1000,
+                                                             args.style_markers, args.repeat)
+        if args.serve:
+            rate, p50, p99 = bench_server(fname, args.concurrency, args.requests)
+            results['serve_requests_per_s'] = rate
+            results['serve_p50_ms'] = p50 * 1000
+            results['serve_p99_ms'] = p99 * 1000
+    finally:
+        shutil.rmtree(folder)
+
+    report = {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'config': config,
+        'results': results,
+    }
+    print('%d entries, %d resources, engine %s, %s, compression %d%s' %
+          (args.entries, args.resources, args.version, args.encoding, args.compression,
+           ', encrypted' if args.encrypted else ''))
+    for name, value in sorted(results.items()):
+        if value is not None:
+            print('  %-24s %10.3f' % (name, value))
+    if args.compare:
+        f = open(args.compare)
+        compare(report, json.load(f))
+        f.close()
+    if args.output:
+        f = open(args.output, 'w')
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.close()
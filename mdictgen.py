@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# mdictgen.py
+# Synthetic MDict dictionary (.mdx) and resource (.mdd) writer, for benchmarks of readmdict.py
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+
+"""
+Write synthetic MDX and MDD files following the layout read by readmdict.py.
+
+    >>> from mdictgen import *
+    >>> write_mdx('synthetic.mdx', synthetic_entries(1000))
+    >>> write_mdd('synthetic.mdd', synthetic_resources(100))
+    >>> write_mdx('styled.mdx', synthetic_styled_entries(1000, 300), stylesheet=synthetic_stylesheet(20))
+
+Engine version 1.2 or 2.0, the encoding, block sizes, block compression and
+the encryption of the key block info (Encrypted="2") are configurable.
+"""
+
+from struct import pack
+import random
+import re
+import zlib
+
+from ripemd128 import ripemd128
+
+try:
+    import lzo
+except ImportError:
+    lzo = None
+
+# characters ignored when sorting keys, as readmdict does with StripKey="Yes"
+_STRIP_KEY_PATTERN = re.compile(u'[\\W_]+', re.UNICODE)
+
+try:
+    _casefold = type(u'').casefold
+except AttributeError:
+    # python 2
+    _casefold = type(u'').lower
+
+# compression types of key and record blocks
+NO_COMPRESSION = 0
+LZO_COMPRESSION = 1
+ZLIB_COMPRESSION = 2
+
+
+def _sort_key(key):
+    return _casefold(_STRIP_KEY_PATTERN.sub(u'', key)), key
+
+
+def synthetic_entries(num_entries, seed=0):
+    """
+    return num_entries (key, definition) pairs of random distinct words
+    """
+    rand = random.Random(seed)
+    letters = u'abcdefghijklmnopqrstuvwxyz'
+    keys = set()
+    while len(keys) < num_entries:
+        word = u''.join(rand.choice(letters) for i in range(rand.randint(3, 12)))
+        if rand.random() < 0.1:
+            word = word.capitalize()
+        keys.add(word)
+    # the definitions are not all ascii, to exercise the encoding
+    return [(key, u'<b>%s</b> definition of %s, entry %d \u00e9t\u00e9 \u8bcd\u6761' % (key, key, i))
+            for i, key in enumerate(sorted(keys))]
+
+
+def synthetic_stylesheet(num_styles):
+    """
+    return a stylesheet {number: (style_begin, style_end)} of num_styles styles
+    """
+    return dict((n, (u'<span class="s%d">' % n, u'</span>')) for n in range(1, num_styles + 1))
+
+
+def synthetic_styled_entries(num_entries, markers, num_styles=20, seed=0):
+    """
+    return num_entries (key, definition) pairs whose definitions hold
+    markers style markers `number` of a synthetic_stylesheet(num_styles)
+    """
+    rand = random.Random(seed)
+    entries = []
+    for key, definition in synthetic_entries(num_entries, seed):
+        parts = [definition]
+        for i in range(markers):
+            parts.append(u'`%d`sense %d of %s' % (rand.randint(1, num_styles), i, key))
+            if rand.random() < 0.2:
+                parts.append(u'\r\n')
+        entries.append((key, u''.join(parts)))
+    return entries
+
+
+def _escape_attribute(text):
+    return text.replace(u'&', u'&amp;').replace(u'<', u'&lt;').replace(u'>', u'&gt;').replace(u'"', u'&quot;')
+
+
+def synthetic_resources(num_resources, size=4096, seed=0):
+    """
+    return num_resources (path, content) pairs of random files of about size bytes,
+    in a few folders, e.g. (u'\\\\img3\\\\abcd.png', b'...')
+    """
+    rand = random.Random(seed)
+    letters = u'abcdefghijklmnopqrstuvwxyz'
+    extensions = [u'png', u'jpg', u'mp3', u'css']
+    paths = set()
+    while len(paths) < num_resources:
+        name = u''.join(rand.choice(letters) for i in range(rand.randint(3, 12)))
+        paths.add(u'\\%s%d\\%s.%s' % (rand.choice([u'img', u'snd']), rand.randint(0, 9),
+                                       name, rand.choice(extensions)))
+    resources = []
+    for path in sorted(paths):
+        # half random, half repeated bytes, so that blocks compress somewhat
+        length = rand.randint(size // 2, size * 3 // 2)
+        noise = bytes(bytearray(rand.getrandbits(8) for i in range(length // 2)))
+        resources.append((path, noise + b'\x00' * (length - len(noise))))
+    return resources
+
+
+def _compress_block(data, compression=ZLIB_COMPRESSION):
+    # 4 bytes compression type, 4 bytes adler32 of decompressed data
+    if compression == NO_COMPRESSION:
+        body = data
+    elif compression == LZO_COMPRESSION:
+        if lzo is None:
+            raise RuntimeError("LZO compression is not supported")
+        # strip the 5 bytes header of python-lzo, readmdict adds it back
+        body = lzo.compress(data)[5:]
+    elif compression == ZLIB_COMPRESSION:
+        body = zlib.compress(data)
+    else:
+        raise RuntimeError("unknown block compression type %r" % compression)
+    return pack('<I', compression) + pack('>I', zlib.adler32(data) & 0xffffffff) + body
+
+
+def _mdx_encrypt(comp_block):
+    """
+    inverse of readmdict._mdx_decrypt, for key block info of Encrypted="2" files
+    """
+    key = bytearray(ripemd128(comp_block[4:8] + pack(b'<L', 0x3695)))
+    data = bytearray(comp_block[8:])
+    previous = 0x36
+    for i in range(len(data)):
+        t = data[i] ^ previous ^ (i & 0xff) ^ key[i % len(key)]
+        data[i] = previous = ((t >> 4) | (t << 4)) & 0xff
+    return comp_block[:8] + bytes(data)
+
+
+def _split_blocks(items, block_size):
+    """
+    group byte strings into blocks of at least block_size bytes
+    """
+    blocks = []
+    current = []
+    size = 0
+    for item in items:
+        current.append(item)
+        size += len(item)
+        if size >= block_size:
+            blocks.append(current)
+            current = []
+            size = 0
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def _write(fname, tag, entries, encoding, version, compression, encrypted,
+           key_block_size, record_block_size, attributes):
+    """
+    write (key, record) pairs, key unicode and record bytes, sorted as readmdict
+    collates them, with key and record blocks of the given sizes
+    """
+    if version not in ('1.2', '2.0'):
+        raise ValueError("engine version must be 1.2 or 2.0")
+    if encrypted & 1:
+        raise ValueError("record block encryption (Encrypted=\"1\") is not supported")
+    v2 = version == '2.0'
+    number_format = '>Q' if v2 else '>I'
+    if encoding.upper() in ('UTF-16', 'UTF-16LE'):
+        codec = 'utf-16-le'
+        term = b'\x00\x00'
+        char_width = 2
+    else:
+        codec = encoding
+        term = b'\x00'
+        char_width = 1
+    entries = sorted(entries, key=lambda e: _sort_key(e[0]))
+
+    header = (u'<%s GeneratedByEngineVersion="%s" RequiredEngineVersion="%s" Encrypted="%d" '
+              u'%sKeyCaseSensitive="No" StripKey="Yes"/>\r\n\x00' %
+              (tag, version, version, encrypted, attributes)).encode('utf-16-le')
+    data = [pack('>I', len(header)), header, pack('<I', zlib.adler32(header) & 0xffffffff)]
+
+    def number(*values):
+        return b''.join(pack(number_format, value) for value in values)
+
+    # key entries pointing at records
+    key_entries = []
+    offset = 0
+    for key, record in entries:
+        key_entries.append(number(offset) + key.encode(codec) + term)
+        offset += len(record)
+
+    # key blocks and key block info
+    key_block_info = []
+    compressed_key_blocks = []
+    position = 0
+    for block in _split_blocks(key_entries, key_block_size):
+        keys = [key for key, _ in entries[position:position+len(block)]]
+        position += len(block)
+        raw = b''.join(block)
+        compressed = _compress_block(raw, compression)
+        compressed_key_blocks.append(compressed)
+        key_block_info.append(number(len(block)))
+        for text in (keys[0], keys[-1]):
+            encoded = text.encode(codec)
+            if v2:
+                key_block_info.append(pack('>H', len(encoded) // char_width) + encoded + term)
+            else:
+                key_block_info.append(pack('>B', len(encoded) // char_width) + encoded)
+        key_block_info.append(number(len(compressed), len(raw)))
+    key_block_info = b''.join(key_block_info)
+    key_block_data = b''.join(compressed_key_blocks)
+    if v2:
+        key_block_info_compressed = _compress_block(key_block_info)
+        if encrypted & 2:
+            key_block_info_compressed = _mdx_encrypt(key_block_info_compressed)
+        numbers = number(len(compressed_key_blocks), len(entries), len(key_block_info),
+                         len(key_block_info_compressed), len(key_block_data))
+        data += [numbers, pack('>I', zlib.adler32(numbers) & 0xffffffff)]
+    else:
+        if encrypted & 2:
+            raise ValueError("key block info is only encrypted in engine 2.0 files")
+        key_block_info_compressed = key_block_info
+        data.append(number(len(compressed_key_blocks), len(entries),
+                           len(key_block_info), len(key_block_data)))
+    data += [key_block_info_compressed, key_block_data]
+
+    # record blocks and record block info
+    record_block_info = []
+    record_block_data = []
+    record_blocks = _split_blocks([record for _, record in entries], record_block_size)
+    for block in record_blocks:
+        raw = b''.join(block)
+        compressed = _compress_block(raw, compression)
+        record_block_info.append(number(len(compressed), len(raw)))
+        record_block_data.append(compressed)
+    record_block_info = b''.join(record_block_info)
+    record_block_data = b''.join(record_block_data)
+    data += [number(len(record_blocks), len(entries), len(record_block_info), len(record_block_data)),
+             record_block_info, record_block_data]
+
+    f = open(fname, 'wb')
+    for chunk in data:
+        f.write(chunk)
+    f.close()
+
+
+def write_mdx(fname, entries, encoding='UTF-8', block_size=16384, version='2.0',
+              compression=ZLIB_COMPRESSION, encrypted=0, key_block_size=None, stylesheet=None):
+    """
+    write (key, definition) unicode pairs to a MDX file of engine version
+    '1.2' or '2.0', encoding e.g. 'UTF-8', 'UTF-16' or 'GB18030', record blocks
+    of at least block_size bytes and key blocks of at least key_block_size
+    bytes, default block_size, compressed with compression, key block info
+    encrypted if encrypted is 2, with an optional stylesheet
+    {number: (style_begin, style_end)}
+    """
+    if encoding.upper() in ('UTF-16', 'UTF-16LE'):
+        codec = 'utf-16-le'
+        term = b'\x00\x00'
+    else:
+        codec = encoding
+        term = b'\x00'
+    records = [(key, definition.encode(codec) + term) for key, definition in entries]
+    attributes = (u'Encoding="%s" Format="Html" Title="Synthetic" '
+                  u'Description="Synthetic dictionary" ' % encoding)
+    if stylesheet:
+        lines = []
+        for number in sorted(stylesheet):
+            lines.extend([u'%d' % number, stylesheet[number][0], stylesheet[number][1]])
+        attributes += u'StyleSheet="%s" ' % _escape_attribute(u'\n'.join(lines))
+    _write(fname, u'Dictionary', records, encoding, version, compression, encrypted,
+           key_block_size or block_size, block_size, attributes)
+
+
+def write_mdd(fname, resources, block_size=65536, version='2.0',
+              compression=ZLIB_COMPRESSION, encrypted=0, key_block_size=None):
+    """
+    write (path, content) pairs, path unicode with backslashes and content
+    bytes, to a MDD file, with the same options as write_mdx
+    """
+    _write(fname, u'Library_Data', resources, 'UTF-16', version, compression, encrypted,
+           key_block_size or 16384, block_size, u'Encoding="" Format="" ')
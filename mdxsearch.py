@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# mdxsearch.py
+# Full-text search inside MDict dictionary (.mdx) definitions
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+
+"""
+Full-text inverted index over the definitions of an MDX file.
+
+The index is built in one pass over MDX.items() and written next to the
+dictionary. A query only reads the postings of its terms, then decodes the
+record blocks of the best matches. The index file is memory mapped as typed
+arrays, which needs Python 3.
+
+    >>> from readmdict import MDX
+    >>> from mdxsearch import open_index
+    >>> mdx = MDX('oald8.mdx')
+    >>> index = open_index(mdx)
+    >>> for key, value in index.results(mdx, 'musical instrument'):
+    ...     print(key)
+"""
+
+from struct import pack, unpack, error as struct_error
+from array import array
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+from html import unescape as _unescape_html
+
+from readmdict import KeyList, _bisect_left
+
+# index file layout:
+#   8 bytes magic, 4 bytes little endian length of the json metadata,
+#   json metadata, then 8-byte aligned sections listed in the metadata
+_FTS_MAGIC = b'MDXFTS\x00\x01'
+_FTS_VERSION = 1
+
+_TAG_PATTERN = re.compile(u'<[^>]*>')
+_TOKEN_PATTERN = re.compile(u'\\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    return the casefolded words of text, with html tags and entities removed
+    """
+    text = _unescape_html(_TAG_PATTERN.sub(u' ', text))
+    return _TOKEN_PATTERN.findall(text.casefold())
+
+
+def _write_varint(buf, value):
+    while value >= 0x80:
+        buf.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buf.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def build_index(mdx, path):
+    """
+    stream all definitions of mdx once and write their inverted index to path
+    """
+    # term -> bytearray of varint (entry delta, term frequency) pairs
+    postings = {}
+    last_entry = {}
+    doc_freq = {}
+    num_entries = 0
+    for entry, (key, value) in enumerate(mdx.items()):
+        num_entries += 1
+        counts = {}
+        for token in tokenize(value.decode('utf-8', 'ignore')):
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            buf = postings.get(token)
+            if buf is None:
+                buf = postings[token] = bytearray()
+                last_entry[token] = 0
+                doc_freq[token] = 0
+            _write_varint(buf, entry - last_entry[token])
+            _write_varint(buf, count)
+            last_entry[token] = entry
+            doc_freq[token] += 1
+
+    # terms sorted as utf-8, each term's id is the offset of its postings
+    terms = KeyList()
+    postings_data = bytearray()
+    for term in sorted(t.encode('utf-8') for t in postings):
+        token = term.decode('utf-8')
+        terms.append(len(postings_data), term)
+        _write_varint(postings_data, doc_freq[token])
+        postings_data += postings[token]
+
+    sections = [
+        ('postings_offsets', 'Q', terms.key_ids),
+        ('term_offsets', 'Q', terms.text_offsets),
+        ('terms', 'B', terms.texts),
+        ('postings', 'B', postings_data),
+    ]
+    meta = mdx._index_metadata()
+    meta['fts_version'] = _FTS_VERSION
+    meta['num_entries'] = num_entries
+    meta['sections'] = {}
+    offset = 0
+    for name, typecode, data in sections:
+        size = len(data) * array(typecode).itemsize
+        meta['sections'][name] = [offset, size, typecode]
+        offset += (size + 7) // 8 * 8
+    meta_bytes = json.dumps(meta, sort_keys=True).encode('utf-8')
+    meta_bytes += b' ' * (-(len(_FTS_MAGIC) + 4 + len(meta_bytes)) % 8)
+
+    tmp_path = path + '.tmp'
+    f = open(tmp_path, 'wb')
+    f.write(_FTS_MAGIC)
+    f.write(pack('<I', len(meta_bytes)))
+    f.write(meta_bytes)
+    for name, typecode, data in sections:
+        data = memoryview(data).cast('B')
+        f.write(data)
+        f.write(b'\x00' * (-len(data) % 8))
+    f.close()
+    os.replace(tmp_path, path)
+
+
+class FullTextIndex(object):
+    """
+    Memory mapped full-text index written by build_index.
+    """
+    def __init__(self, path):
+        f = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        if self._mmap[:len(_FTS_MAGIC)] != _FTS_MAGIC:
+            self._mmap.close()
+            raise ValueError('%s is not a full-text index file' % path)
+        try:
+            meta_size = unpack('<I', self._mmap[len(_FTS_MAGIC):len(_FTS_MAGIC)+4])[0]
+            meta_start = len(_FTS_MAGIC) + 4
+            self.meta = json.loads(self._mmap[meta_start:meta_start+meta_size].decode('utf-8'))
+            if not isinstance(self.meta, dict):
+                raise ValueError('bad metadata')
+            view = memoryview(self._mmap)
+            data_start = meta_start + meta_size
+            sections = {}
+            for name, (offset, size, typecode) in self.meta['sections'].items():
+                start = data_start + offset
+                if offset < 0 or size < 0 or start + size > len(self._mmap):
+                    raise ValueError('truncated index')
+                sections[name] = view[start:start+size].cast(typecode)
+            if len(sections['term_offsets']) != len(sections['postings_offsets']) + 1:
+                raise ValueError('inconsistent sections')
+            self.num_entries = self.meta['num_entries']
+            self._terms = KeyList(sections['postings_offsets'], sections['term_offsets'], sections['terms'])
+            self._postings = sections['postings']
+        except (ValueError, KeyError, TypeError, struct_error) as e:
+            sections = view = None
+            self._mmap.close()
+            raise ValueError('%s is a corrupt full-text index file: %s' % (path, e))
+
+    def close(self):
+        self._terms = None
+        self._postings = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def postings(self, term):
+        """
+        return the list of (entry, term frequency) of a casefolded term
+        """
+        term = term.encode('utf-8')
+        terms = self._terms
+        i = _bisect_left(terms.key_text, len(terms), term)
+        if i >= len(terms) or terms.key_text(i) != term:
+            return []
+        data = self._postings
+        doc_freq, pos = _read_varint(data, terms.key_ids[i])
+        result = []
+        entry = 0
+        for j in range(doc_freq):
+            delta, pos = _read_varint(data, pos)
+            count, pos = _read_varint(data, pos)
+            entry += delta
+            result.append((entry, count))
+        return result
+
+    def search(self, query, limit=10):
+        """
+        return up to limit (entry, score) pairs ranked by tf-idf
+        for the words of query
+        """
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings(term)
+            if not postings:
+                continue
+            idf = math.log(1.0 + float(self.num_entries) / len(postings))
+            for entry, count in postings:
+                scores[entry] = scores.get(entry, 0.0) + (1.0 + math.log(count)) * idf
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def results(self, mdx, query, limit=10):
+        """
+        return (key, value) of the best matches of query,
+        decoding each record block that holds them once
+        """
+        entries = [entry for entry, score in self.search(query, limit)]
+        records = mdx._read_records(entries)
+        return [(mdx._get_key(entry)[1], mdx._treat_record_data(record))
+                for entry, record in zip(entries, records)]
+
+
+def open_index(mdx, path=None):
+    """
+    return the full-text index of mdx at path, default mdx file name + '.fts',
+    building it first if it is missing or stale
+    """
+    if path is None:
+        path = mdx._fname + '.fts'
+    try:
+        index = FullTextIndex(path)
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        index = None
+    if index is not None:
+        current = mdx._index_metadata()
+        if all(index.meta.get(name) == value for name, value in current.items()) and \
+                index.meta.get('fts_version') == _FTS_VERSION:
+            return index
+        index.close()
+    build_index(mdx, path)
+    return FullTextIndex(path)
+
+
+if __name__ == '__main__':
+    import argparse
+    from readmdict import MDX
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--limit', default=10, type=int,
+                        help='number of results')
+    parser.add_argument("filename", help="mdx file name")
+    parser.add_argument("query", help="words to search in definitions")
+    args = parser.parse_args()
+
+    mdx = MDX(args.filename)
+    index = open_index(mdx)
+    for key, value in index.results(mdx, args.query, args.limit):
+        print(key.decode('utf-8'))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# mdxserver.py
+# HTTP server for MDict dictionary (.mdx) definitions and resource (.mdd) files
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+
+"""
+Serve the definitions of an MDX file and the resources of its companion MDD
+file over HTTP, opening both once.
+
+    GET /entry/<key>    definition of key, as utf-8 html
+    GET /res/<path>     resource referred to by definitions, e.g. /res/img/a.png
+
+Block decompression runs in a thread pool, so the event loop keeps serving
+other connections. Responses carry an ETag made of the adler32 checksum of the
+record block and the record's place in it, which is read without decompressing
+the block, so conditional requests are answered without decompression.
+Single byte ranges are supported, so that audio can be seeked.
+
+    $ python readmdict.py serve oald8.mdx --port 8000
+"""
+
+import asyncio
+import mimetypes
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+from readmdict import MDX, MDD
+
+_REASONS = {
+    200: 'OK',
+    206: 'Partial Content',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    416: 'Range Not Satisfiable',
+    500: 'Internal Server Error',
+}
+
+
+def parse_range(value, size):
+    """
+    return (start, end) of the single byte range in a Range header value for
+    a body of size bytes, start >= end if it is not satisfiable, or None if
+    the header is not understood and the whole body is to be sent
+    """
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            # suffix range: the last bytes of the body
+            length = int(last)
+            if length == 0:
+                return size, size
+            return max(size - length, 0), size
+        start = int(first)
+        end = int(last) + 1 if last else max(size, start + 1)
+    except ValueError:
+        return None
+    if start < 0 or end <= start:
+        return None
+    return start, min(end, size)
+
+
+def _find(mdict, find, key):
+    """
+    return (index, etag) of key found by find, or (-1, None)
+    """
+    index = find(key)
+    if index < 0:
+        return index, None
+    n, adler32, start, end = mdict._record_checksum(index)
+    return index, '"%08x-%x-%x-%x"' % (adler32, n, start, end)
+
+
+class MDictServer(object):
+    """
+    asyncio HTTP server over an opened MDX and/or MDD
+    """
+    def __init__(self, mdx=None, mdd=None, workers=4):
+        self.mdx = mdx
+        self.mdd = mdd
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def handle(self, reader, writer):
+        """
+        serve the requests of one connection, kept alive as HTTP/1.1 allows
+        """
+        try:
+            while True:
+                headers = {}
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                except ValueError:
+                    # line longer than the stream buffer limit
+                    request_line = b''
+                request = request_line.decode('latin-1').split()
+                if len(request) != 3:
+                    writer.write(self._head(400, {'Connection': 'close', 'Content-Length': '0'}))
+                    await writer.drain()
+                    break
+                method, target, version = request
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.1':
+                    keep_alive = connection != 'close'
+                else:
+                    keep_alive = connection == 'keep-alive'
+
+                try:
+                    status, response_headers, body = await self.respond(method, target, headers)
+                except Exception as e:
+                    # e.g. a corrupt record block
+                    print('Error serving %s: %r' % (target, e))
+                    status, response_headers, body = 500, {}, b''
+                response_headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+                response_headers['Content-Length'] = str(len(body))
+                writer.write(self._head(status, response_headers))
+                if method != 'HEAD' and body:
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _head(self, status, headers):
+        lines = ['HTTP/1.1 %d %s' % (status, _REASONS[status])]
+        for name, value in headers.items():
+            lines.append('%s: %s' % (name, value))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def respond(self, method, target, headers):
+        """
+        return (status, headers, body) answering a request
+        """
+        if method not in ('GET', 'HEAD'):
+            return 405, {'Allow': 'GET, HEAD'}, b''
+        path = unquote(target.split('?', 1)[0])
+        if path.startswith('/entry/') and self.mdx is not None:
+            mdict = self.mdx
+            key = path[len('/entry/'):]
+            find = lambda key: mdict._find_key(key, True)
+            content_type = 'text/html; charset=utf-8'
+        elif path.startswith('/res/') and self.mdd is not None:
+            mdict = self.mdd
+            key = path[len('/res/'):]
+            find = mdict._find_resource
+            content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        else:
+            return 404, {}, b''
+
+        index, etag = await self._run(_find, mdict, find, key)
+        if index < 0:
+            return 404, {}, b''
+        response_headers = {'ETag': etag, 'Accept-Ranges': 'bytes'}
+        if_none_match = headers.get('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            if etag in tags or '*' in tags:
+                return 304, response_headers, b''
+
+        if mdict is self.mdd:
+            body = (await self._run(mdict.entry, index, True))[1]
+        else:
+            body = (await self._run(mdict.entry, index))[1]
+        response_headers['Content-Type'] = content_type
+
+        byte_range = headers.get('range')
+        if byte_range is not None and headers.get('if-range', etag) == etag:
+            byte_range = parse_range(byte_range, len(body))
+            if byte_range is not None:
+                start, end = byte_range
+                if start >= end:
+                    response_headers['Content-Range'] = 'bytes */%d' % len(body)
+                    return 416, response_headers, b''
+                response_headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end - 1, len(body))
+                return 206, response_headers, body[start:end]
+        return 200, response_headers, body
+
+    async def serve(self, host='127.0.0.1', port=8000, ready=None):
+        """
+        serve forever, calling ready with the bound (host, port) once listening
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[:2])
+        async with server:
+            await server.serve_forever()
+
+
+def open_server(filename, encoding='', substyle=False, passcode=None, workers=4, cache_size=64 << 20):
+    """
+    open filename, a MDX or MDD file, and the companion MDD of a MDX file
+    """
+    base, ext = os.path.splitext(filename)
+    options = dict(passcode=passcode, cache_size=cache_size, use_mmap=True)
+    mdx = mdd = None
+    if ext.lower() == os.path.extsep + 'mdx':
+        mdx = MDX(filename, encoding, substyle, **options)
+        mdd_filename = base + os.path.extsep + 'mdd'
+        if os.path.exists(mdd_filename):
+            mdd = MDD(mdd_filename, **options)
+    else:
+        mdd = MDD(filename, **options)
+    # build the lookup indexes now, not on demand in concurrent worker threads
+    if mdx is not None:
+        mdx._load_keys()
+        if mdx._sorted_index is None:
+            mdx._build_sorted_index()
+        if mdx._collation_index is None:
+            mdx._build_collation_index()
+    if mdd is not None:
+        mdd._build_resource_index()
+    return MDictServer(mdx, mdd, workers)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='readmdict.py serve')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='address to listen on')
+    parser.add_argument('--port', default=8000, type=int,
+                        help='port to listen on')
+    parser.add_argument('-e', '--encoding', default='',
+                        help='encoding of the mdx file, overriding its header')
+    parser.add_argument('-s', '--substyle', action='store_true',
+                        help='substitute style definition if present')
+    parser.add_argument('-j', '--jobs', default=4, type=int,
+                        help='number of threads decompressing record blocks')
+    parser.add_argument('-c', '--cache', default=64, type=int,
+                        help='MB of decompressed record blocks kept in memory')
+    parser.add_argument('filename', help='mdx or mdd file name')
+    args = parser.parse_args(argv)
+
+    server = open_server(args.filename, args.encoding, args.substyle,
+                         workers=args.jobs, cache_size=args.cache << 20)
+    ready = lambda address: print('Serving %s on http://%s:%d/' % ((args.filename,) + tuple(address)))
+    try:
+        asyncio.run(server.serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
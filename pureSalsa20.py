@@ -185,11 +185,18 @@ little_u64 = Struct( "<Q" )      #    little-endian 64-bit unsigned.
                                  #    Unpacks to a tuple of one element!
 
 little16_i32 = Struct( "<16i" )  # 16 little-endian 32-bit signed ints.
+little16_u32 = Struct( "<16I" )  # 16 little-endian 32-bit unsigned ints.
 little4_i32 = Struct( "<4i" )    #  4 little-endian 32-bit signed ints.
 little2_i32 = Struct( "<2i" )    #  2 little-endian 32-bit signed ints.
 
 _version = 'p4.0'
 
+# NumPy, if available, computes many keystream blocks in one pass
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 #----------- Salsa20 class which emulates pySalsa20.Salsa20 ---------------
 
 class Salsa20(object):
@@ -251,6 +258,17 @@ class Salsa20(object):
         assert type(data) == bytes, 'data must be byte string'
         assert self._lastChunk64, 'previous chunk not multiple of 64 bytes'
         lendata = len(data)
+        if python3:
+            # whole keystream at once, then one xor over the whole buffer
+            nBlocks = ( lendata + 63 ) // 64
+            counter = self.getCounter()
+            stream = salsa20_keystream( self.ctx, self.rounds, counter, nBlocks )
+            self.setCounter( ( counter + nBlocks ) % 2**64 )
+            self._lastChunk64 = not lendata % 64
+            munged = int.from_bytes( data, 'little' ) ^ \
+                int.from_bytes( stream[ :lendata ], 'little' )
+            return munged.to_bytes( lendata, 'little' )
+
         munged = bytearray(lendata)
         for i in range( 0, lendata, 64 ):
             h = salsa20_wordtobyte( self.ctx, self.rounds, checkRounds=False )
@@ -325,6 +343,110 @@ def salsa20_wordtobyte( input, nRounds=20, checkRounds=True ):
         x[i] = PLUS( x[i], input[i] )
     return little16_i32.pack( *x )
 
+#------------------------- keystream engine ------------------------------
+
+# the (target, addend, addend, rotation) of every step of a double round
+_doubleRound = (
+    ( 4, 0,12, 7), ( 8, 4, 0, 9), (12, 8, 4,13), ( 0,12, 8,18),
+    ( 9, 5, 1, 7), (13, 9, 5, 9), ( 1,13, 9,13), ( 5, 1,13,18),
+    (14,10, 6, 7), ( 2,14,10, 9), ( 6, 2,14,13), (10, 6, 2,18),
+    ( 3,15,11, 7), ( 7, 3,15, 9), (11, 7, 3,13), (15,11, 7,18),
+    ( 1, 0, 3, 7), ( 2, 1, 0, 9), ( 3, 2, 1,13), ( 0, 3, 2,18),
+    ( 6, 5, 4, 7), ( 7, 6, 5, 9), ( 4, 7, 6,13), ( 5, 4, 7,18),
+    (11,10, 9, 7), ( 8,11,10, 9), ( 9, 8,11,13), (10, 9, 8,18),
+    (12,15,14, 7), (13,12,15, 9), (14,13,12,13), (15,14,13,18),
+)
+
+# below this many blocks NumPy's per-call overhead is not worth it
+_numpyMinBlocks = 16
+
+
+def salsa20_keystream( input, nRounds, counter, nBlocks ):
+    """ Return nBlocks consecutive 64-byte keystream blocks for the state
+        input (16 ints, signed or unsigned), starting at block counter.
+        Words 8 and 9 of input are replaced by the block counter.
+        """
+    state = [ w & 0xffffffff for w in input ]
+    if numpy is not None and nBlocks >= _numpyMinBlocks:
+        return _keystream_numpy( state, nRounds, counter, nBlocks )
+    return _keystream_unsigned( state, nRounds, counter, nBlocks )
+
+
+def _keystream_unsigned( state, nRounds, counter, nBlocks ):
+    """ Pure Python keystream on unsigned 32-bit words, rounds unrolled. """
+    j0, j1, j2, j3, j4, j5, j6, j7, j8, j9, j10, j11, j12, j13, j14, j15 = state
+    out = []
+    pack = little16_u32.pack
+    for b in range( nBlocks ):
+        c = ( counter + b ) & 0xffffffffffffffff
+        j8, j9 = c & 0xffffffff, c >> 32
+        x0, x1, x2, x3, x4, x5, x6, x7 = j0, j1, j2, j3, j4, j5, j6, j7
+        x8, x9, x10, x11, x12, x13, x14, x15 = j8, j9, j10, j11, j12, j13, j14, j15
+        for i in range( nRounds // 2 ):
+            t = (x0 + x12) & 0xffffffff; x4 ^= (t << 7 | t >> 25) & 0xffffffff
+            t = (x4 + x0) & 0xffffffff; x8 ^= (t << 9 | t >> 23) & 0xffffffff
+            t = (x8 + x4) & 0xffffffff; x12 ^= (t << 13 | t >> 19) & 0xffffffff
+            t = (x12 + x8) & 0xffffffff; x0 ^= (t << 18 | t >> 14) & 0xffffffff
+            t = (x5 + x1) & 0xffffffff; x9 ^= (t << 7 | t >> 25) & 0xffffffff
+            t = (x9 + x5) & 0xffffffff; x13 ^= (t << 9 | t >> 23) & 0xffffffff
+            t = (x13 + x9) & 0xffffffff; x1 ^= (t << 13 | t >> 19) & 0xffffffff
+            t = (x1 + x13) & 0xffffffff; x5 ^= (t << 18 | t >> 14) & 0xffffffff
+            t = (x10 + x6) & 0xffffffff; x14 ^= (t << 7 | t >> 25) & 0xffffffff
+            t = (x14 + x10) & 0xffffffff; x2 ^= (t << 9 | t >> 23) & 0xffffffff
+            t = (x2 + x14) & 0xffffffff; x6 ^= (t << 13 | t >> 19) & 0xffffffff
+            t = (x6 + x2) & 0xffffffff; x10 ^= (t << 18 | t >> 14) & 0xffffffff
+            t = (x15 + x11) & 0xffffffff; x3 ^= (t << 7 | t >> 25) & 0xffffffff
+            t = (x3 + x15) & 0xffffffff; x7 ^= (t << 9 | t >> 23) & 0xffffffff
+            t = (x7 + x3) & 0xffffffff; x11 ^= (t << 13 | t >> 19) & 0xffffffff
+            t = (x11 + x7) & 0xffffffff; x15 ^= (t << 18 | t >> 14) & 0xffffffff
+
+            t = (x0 + x3) & 0xffffffff; x1 ^= (t << 7 | t >> 25) & 0xffffffff
+            t = (x1 + x0) & 0xffffffff; x2 ^= (t << 9 | t >> 23) & 0xffffffff
+            t = (x2 + x1) & 0xffffffff; x3 ^= (t << 13 | t >> 19) & 0xffffffff
+            t = (x3 + x2) & 0xffffffff; x0 ^= (t << 18 | t >> 14) & 0xffffffff
+            t = (x5 + x4) & 0xffffffff; x6 ^= (t << 7 | t >> 25) & 0xffffffff
+            t = (x6 + x5) & 0xffffffff; x7 ^= (t << 9 | t >> 23) & 0xffffffff
+            t = (x7 + x6) & 0xffffffff; x4 ^= (t << 13 | t >> 19) & 0xffffffff
+            t = (x4 + x7) & 0xffffffff; x5 ^= (t << 18 | t >> 14) & 0xffffffff
+            t = (x10 + x9) & 0xffffffff; x11 ^= (t << 7 | t >> 25) & 0xffffffff
+            t = (x11 + x10) & 0xffffffff; x8 ^= (t << 9 | t >> 23) & 0xffffffff
+            t = (x8 + x11) & 0xffffffff; x9 ^= (t << 13 | t >> 19) & 0xffffffff
+            t = (x9 + x8) & 0xffffffff; x10 ^= (t << 18 | t >> 14) & 0xffffffff
+            t = (x15 + x14) & 0xffffffff; x12 ^= (t << 7 | t >> 25) & 0xffffffff
+            t = (x12 + x15) & 0xffffffff; x13 ^= (t << 9 | t >> 23) & 0xffffffff
+            t = (x13 + x12) & 0xffffffff; x14 ^= (t << 13 | t >> 19) & 0xffffffff
+            t = (x14 + x13) & 0xffffffff; x15 ^= (t << 18 | t >> 14) & 0xffffffff
+
+        out.append( pack(
+            (x0 + j0) & 0xffffffff, (x1 + j1) & 0xffffffff,
+            (x2 + j2) & 0xffffffff, (x3 + j3) & 0xffffffff,
+            (x4 + j4) & 0xffffffff, (x5 + j5) & 0xffffffff,
+            (x6 + j6) & 0xffffffff, (x7 + j7) & 0xffffffff,
+            (x8 + j8) & 0xffffffff, (x9 + j9) & 0xffffffff,
+            (x10 + j10) & 0xffffffff, (x11 + j11) & 0xffffffff,
+            (x12 + j12) & 0xffffffff, (x13 + j13) & 0xffffffff,
+            (x14 + j14) & 0xffffffff, (x15 + j15) & 0xffffffff ) )
+    return b''.join( out )
+
+
+def _keystream_numpy( state, nRounds, counter, nBlocks ):
+    """ NumPy keystream: a 16 x nBlocks uint32 state, one column per block,
+        so every step of the rounds runs over all blocks at once.
+        """
+    counters = numpy.arange( nBlocks, dtype=numpy.uint64 ) + numpy.uint64( counter )
+    j = numpy.empty( ( 16, nBlocks ), dtype=numpy.uint32 )
+    j[:] = numpy.array( state, dtype=numpy.uint32 )[:, None]
+    j[8] = ( counters & numpy.uint64( 0xffffffff ) ).astype( numpy.uint32 )
+    j[9] = ( counters >> numpy.uint64( 32 ) ).astype( numpy.uint32 )
+    x = j.copy()
+    t = numpy.empty( nBlocks, dtype=numpy.uint32 )
+    for i in range( nRounds // 2 ):
+        for a, b, c, k in _doubleRound:
+            numpy.add( x[b], x[c], out=t )
+            x[a] ^= ( t << k ) | ( t >> ( 32 - k ) )
+    x += j
+    return x.T.astype( '<u4' ).tobytes()
+
 #--------------------------- 32-bit ops -------------------------------
 
 def trunc32( w ):
@@ -17,10 +17,21 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
 # GNU General Public License for more details.
 
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from, error as struct_error
+from functools import partial
+from itertools import chain
 from io import BytesIO
+from bisect import bisect_right
+from array import array
+from collections import OrderedDict
+import codecs
+import threading
+import mmap
+import json
+import os
 import re
 import sys
+import time
 
 from ripemd128 import ripemd128
 from pureSalsa20 import Salsa20
@@ -34,9 +45,33 @@ except ImportError:
     lzo = None
     print("LZO compression support is not available")
 
+# thread pool is used for parallel record block decompression
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
 # 2x3 compatible
 if sys.hexversion >= 0x03000000:
     unicode = str
+    _casefold = str.casefold
+else:
+    _casefold = unicode.lower
+
+# array typecode of offsets, python 2 has no 'Q'
+try:
+    _UINT64 = array('Q').typecode
+except ValueError:
+    _UINT64 = 'L'
+
+try:
+    from itertools import accumulate as _accumulate
+except ImportError:
+    def _accumulate(iterable):
+        total = 0
+        for value in iterable:
+            total += value
+            yield total
 
 
 def _unescape_entities(text):
@@ -50,7 +85,7 @@ def _unescape_entities(text):
     return text
 
 
-def _fast_decrypt(data, key):
+def _fast_decrypt_loop(data, key):
     b = bytearray(data)
     key = bytearray(key)
     previous = 0x36
@@ -62,9 +97,41 @@ def _fast_decrypt(data, key):
     return bytes(b)
 
 
+# nibble swapped value of every byte
+_NIBBLE_SWAP = bytes(bytearray(((i >> 4) | (i << 4)) & 0xff for i in range(256)))
+
+
+def _fast_decrypt(data, key):
+    """
+    same as _fast_decrypt_loop but on whole buffers:
+    each output byte only depends on the input byte, the previous input byte,
+    its index and the key, so all terms are built as byte strings and
+    xor-ed together as big integers
+    """
+    if not hasattr(int, 'from_bytes'):
+        return _fast_decrypt_loop(data, key)
+    data = bytes(data)
+    size = len(data)
+    if size == 0:
+        return b''
+    key = bytearray(key)
+    # (i & 0xff) ^ key[i % len(key)] repeats every lcm(256, len(key)) bytes
+    period = 256
+    while period % len(key):
+        period += 256
+    pattern = bytes(bytearray((i & 0xff) ^ key[i % len(key)] for i in range(period)))
+    stream = pattern * (size // period + 1)
+    swapped = data.translate(_NIBBLE_SWAP)
+    previous = b'\x36' + data[:-1]
+    result = int.from_bytes(swapped, 'little') ^ \
+        int.from_bytes(previous, 'little') ^ \
+        int.from_bytes(stream[:size], 'little')
+    return result.to_bytes(size, 'little')
+
+
 def _mdx_decrypt(comp_block):
-    key = ripemd128(comp_block[4:8] + pack(b'<L', 0x3695))
-    return comp_block[0:8] + _fast_decrypt(comp_block[8:], key)
+    key = ripemd128(bytes(comp_block[4:8]) + pack(b'<L', 0x3695))
+    return bytes(comp_block[0:8]) + _fast_decrypt(comp_block[8:], key)
 
 
 def _salsa_decrypt(ciphertext, encrypt_key):
@@ -86,26 +153,401 @@ def _decrypt_regcode_by_email(reg_code, email):
     return encrypt_key
 
 
+# sidecar index file layout:
+#   8 bytes magic, 4 bytes little endian length of the json metadata,
+#   json metadata, then 8-byte aligned sections listed in the metadata
+_INDEX_MAGIC = b'MDXIDX\x00\x01'
+_INDEX_VERSION = 2
+
+# byte budget of decoded key blocks kept in lazy mode
+_KEY_BLOCK_CACHE_SIZE = 1024 * 1024
+
+# high resolution wall clock of Stats
+_clock = getattr(time, 'perf_counter', time.time)
+
+# style markers `number` of records of dictionaries with a StyleSheet
+_STYLE_TAG_PATTERN = re.compile(b'`(\\d+)`')
+
+# characters ignored in key comparison when StripKey is on
+_STRIP_KEY_PATTERN = re.compile(u'[\\W_]+', re.UNICODE)
+
+
+def _bisect_left(text_at, size, text):
+    """
+    leftmost position in a sorted sequence of size items, whose i-th item is
+    text_at(i), at which text could be inserted
+    """
+    lo, hi = 0, size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if text_at(mid) < text:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class KeyList(object):
+    """
+    Compact sequence of (key_id, key_text) entries.
+    key ids are kept in an array, key texts are concatenated in one buffer
+    delimited by an array of offsets.
+    """
+    def __init__(self, key_ids=None, text_offsets=None, texts=None):
+        if key_ids is None:
+            key_ids = array(_UINT64)
+            text_offsets = array(_UINT64, [0])
+            texts = bytearray()
+        self.key_ids = key_ids
+        self.text_offsets = text_offsets
+        self.texts = texts
+
+    def __len__(self):
+        return len(self.key_ids)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.key_ids)
+        return self.key_ids[i], self.key_text(i)
+
+    def __iter__(self):
+        for i in range(len(self.key_ids)):
+            yield self.key_ids[i], self.key_text(i)
+
+    def key_text(self, i):
+        return bytes(self.texts[self.text_offsets[i]:self.text_offsets[i+1]])
+
+    def key_texts(self):
+        for i in range(len(self.key_ids)):
+            yield self.key_text(i)
+
+    def append(self, key_id, key_text):
+        self.key_ids.append(key_id)
+        self.texts += key_text
+        self.text_offsets.append(len(self.texts))
+
+    def extend_keys(self, key_ids, key_texts):
+        """
+        append lists of key ids and key texts
+        """
+        self.key_ids.extend(key_ids)
+        offsets = _accumulate(chain([len(self.texts)], map(len, key_texts)))
+        # skip the initial value, it is already the last offset
+        next(offsets)
+        self.text_offsets.extend(offsets)
+        self.texts += b''.join(key_texts)
+
+    def extend(self, other):
+        base = len(self.texts)
+        self.key_ids.extend(other.key_ids)
+        self.texts += other.texts
+        self.text_offsets.extend(base + o for o in other.text_offsets[1:])
+
+
+class MmapFile(object):
+    """
+    Minimal read-only file object over a shared memory mapping.
+    read() returns memoryview slices of the mapping, no data is copied.
+    """
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+
+    def read(self, size=-1):
+        start = self._pos
+        if size < 0:
+            end = len(self._view)
+        else:
+            end = min(start + size, len(self._view))
+        self._pos = end
+        return self._view[start:end]
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += len(self._view)
+        self._pos = pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        # the mapping is shared, it is closed by its owner
+        pass
+
+
+class BlockCache(object):
+    """
+    LRU cache of decompressed blocks keyed by block index,
+    bounded by the total size in bytes of the cached blocks.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def get(self, n):
+        with self._lock:
+            item = self._blocks.pop(n, None)
+            if item is None:
+                self.misses += 1
+                return None
+            # re-insert as most recently used
+            self._blocks[n] = item
+            self.hits += 1
+            return item[0]
+
+    def put(self, n, block, size=None):
+        """
+        cache block, size defaults to len(block)
+        """
+        if size is None:
+            size = len(block)
+        # a block larger than the whole budget is never cached
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._blocks.pop(n, None)
+            if old is not None:
+                self.size -= old[1]
+            self._blocks[n] = (block, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (evicted, evicted_size) = self._blocks.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self.size = 0
+
+
+class Stats(object):
+    """
+    Wall time per phase of a MDict and counters of the work it did.
+
+    Phases are 'open', 'header', 'key_block_info', 'decrypt',
+    'key_block_decompress', 'split_key_block', 'record_block_info',
+    'record_block_decompress', 'index_load', 'index_save' and 'read_keys_brutal'.
+    'open' covers the whole constructor and 'decrypt' is part of
+    'key_block_info'. Times of blocks decompressed in a thread pool add up.
+
+    callback(phase, seconds) is called at the end of each timed phase.
+    """
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.phases = OrderedDict()
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+        self.key_blocks = 0
+        self.record_blocks = 0
+        self.adler32_checks = 0
+        self._lock = threading.Lock()
+
+    def add_time(self, phase, seconds):
+        with self._lock:
+            total, calls = self.phases.get(phase, (0.0, 0))
+            self.phases[phase] = (total + seconds, calls + 1)
+        if self.callback is not None:
+            self.callback(phase, seconds)
+
+    def add_block(self, kind, compressed_size, decompressed_size):
+        """
+        count a decompressed 'key' or 'record' block and its adler32 check
+        """
+        with self._lock:
+            self.compressed_bytes += compressed_size
+            self.decompressed_bytes += decompressed_size
+            self.adler32_checks += 1
+            if kind == 'key':
+                self.key_blocks += 1
+            else:
+                self.record_blocks += 1
+
+    def add_adler32_check(self):
+        with self._lock:
+            self.adler32_checks += 1
+
+    def as_dict(self):
+        """
+        Return the stats as a dictionary ready to be dumped as JSON.
+        """
+        with self._lock:
+            return {
+                'phases': OrderedDict((phase, {'seconds': total, 'calls': calls})
+                                      for phase, (total, calls) in self.phases.items()),
+                'compressed_bytes': self.compressed_bytes,
+                'decompressed_bytes': self.decompressed_bytes,
+                'key_blocks': self.key_blocks,
+                'record_blocks': self.record_blocks,
+                'adler32_checks': self.adler32_checks,
+            }
+
+
+class _PhaseTimer(object):
+    """
+    context manager adding its wall time to a phase of stats,
+    doing nothing if stats is None
+    """
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+
+    def __enter__(self):
+        if self.stats is not None:
+            self.start = _clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.stats is not None:
+            self.stats.add_time(self.phase, _clock() - self.start)
+
+
 class MDict(object):
     """
-    Base class which reads in header and key block.
-    It has no public methods and serves only as code sharing base class.
+    Base class which reads in header and key block, shared by MDX and MDD.
+    It provides len(), keys(), prefix() and close(), also called on leaving
+    a with block; lookups and items() are provided by the subclasses.
+
+    cache_size is the byte budget of an LRU cache of decompressed record blocks
+    used by random access lookups, 0 disables the cache.
+
+    With use_mmap the file is memory mapped once and all header, key block and
+    record block reads are memoryview slices of the shared mapping.
+
+    With lazy only the key block info is read at open time. Lookups decode the
+    single key block which may hold the key, the full key list is decoded
+    when first iterated.
+
+    index enables a sidecar index file holding the parsed key list and record
+    block table, True for fname + '.idx' or a path. A fresh index is memory
+    mapped instead of parsing the key blocks, a missing or stale one is rebuilt.
+    It is ignored on Python 2.
+
+    stats is a Stats object, or True for a new one, recording into self.stats
+    the time per phase and counts of blocks and bytes decoded.
+
+    key_reader tells how the key blocks were found: 'header' from the numbers
+    preceding them, 'scan' by scanning the file when these are unreadable,
+    e.g. encrypted without passcode, 'index' from the sidecar index.
     """
-    def __init__(self, fname, encoding='', passcode=None):
+    def __init__(self, fname, encoding='', passcode=None, cache_size=0, use_mmap=False, lazy=False,
+                 index=False, stats=None):
+        if stats is True:
+            stats = Stats()
+        self.stats = stats
+        with self._timer('open'):
+            self._open_dict(fname, encoding, passcode, cache_size, use_mmap, lazy, index)
+
+    def _open_dict(self, fname, encoding, passcode, cache_size, use_mmap, lazy, index):
         self._fname = fname
         self._encoding = encoding.upper()
         self._passcode = passcode
-
-        self.header = self._read_header()
+        self._lazy = lazy
+        # decoded key blocks in lazy mode
+        self._key_block_cache = BlockCache(_KEY_BLOCK_CACHE_SIZE)
+        self._mmap = None
+        self._mmap_view = None
+        if use_mmap:
+            with open(fname, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                self._mmap_view = memoryview(self._mmap)
+            except TypeError:
+                # python 2 mmaps have no buffer interface, slices are copies
+                self._mmap_view = self._mmap
+        if cache_size > 0:
+            self.cache = BlockCache(cache_size)
+        else:
+            self.cache = None
+        # built on demand for random access
+        self._sorted_index = None
+        self._collation_index = None
+        self._index_mmap = None
+
+        with self._timer('header'):
+            self.header = self._read_header()
+        if index is True:
+            index = fname + '.idx'
+        if index and not hasattr(memoryview, 'cast'):
+            print("Index files need Python 3, ignoring %s" % index)
+            index = False
+        if index:
+            with self._timer('index_load'):
+                loaded = self._load_index(index)
+            if loaded:
+                self.key_reader = 'index'
+                return
         try:
             self._key_list = self._read_keys()
-        except:
-            print("Try Brutal Force on Encrypted Key Blocks")
-            self._key_list = self._read_keys_brutal()
+            self.key_reader = 'header'
+        except Exception as e:
+            print("Cannot read key blocks from their header (%s), scan for them" % e)
+            with self._timer('read_keys_brutal'):
+                self._key_list = self._read_keys_brutal()
+            self.key_reader = 'scan'
+        with self._timer('record_block_info'):
+            self._read_record_block_info()
+        if index:
+            with self._timer('index_save'):
+                self._save_index(index)
 
     def __len__(self):
         return self._num_entries
 
+    def _timer(self, phase):
+        """
+        context manager timing phase into self.stats if enabled
+        """
+        return _PhaseTimer(self.stats, phase)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Release the memory mapping if any.
+        """
+        if self._mmap is not None:
+            if self._mmap_view is not self._mmap:
+                self._mmap_view.release()
+            try:
+                self._mmap.close()
+            except BufferError:
+                # records still refer to the mapping, leave it to the garbage collector
+                pass
+            self._mmap = None
+            self._mmap_view = None
+        if self._index_mmap is not None:
+            # arrays of the key list are views of the index mapping
+            self._key_list = None
+            self._sorted_index = None
+            self._collation_index = None
+            self._record_block_comp_offsets = None
+            self._record_block_decomp_offsets = None
+            try:
+                self._index_mmap.close()
+            except BufferError:
+                pass
+            self._index_mmap = None
+
+    def _open(self):
+        if self._mmap_view is not None:
+            return MmapFile(self._mmap_view)
+        return open(self._fname, 'rb')
+
     def __iter__(self):
         return self.keys()
 
@@ -113,11 +555,492 @@ class MDict(object):
         """
         Return an iterator over dictionary keys.
         """
-        return (key_value for key_id, key_value in self._key_list)
+        self._load_keys()
+        return self._key_list.key_texts()
+
+    def prefix(self, prefix, limit=None):
+        """
+        Return a list of at most limit keys starting with prefix, compared
+        in the dictionary's collation, in the dictionary's order.
+        """
+        if isinstance(prefix, unicode):
+            prefix = prefix.encode('utf-8')
+        if self._collation_index is None:
+            self._build_collation_index()
+        index = self._collation_index
+        try:
+            collated = self._collation_key(prefix).encode('utf-8')
+        except UnicodeDecodeError:
+            # keys are utf-8, none starts with an invalid sequence
+            return []
+        lo = _bisect_left(index.key_text, len(index), collated)
+        # 0xff never occurs in utf-8, so it sorts after every key with this prefix
+        hi = _bisect_left(index.key_text, len(index), collated + b'\xff')
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        key_text = self._key_list.key_text
+        return [key_text(index.key_ids[i]) for i in range(lo, hi)]
+
+    def _build_collation_index(self):
+        """
+        normalized key index: entry numbers sorted by collation key, i.e. key
+        casefolded and stripped as the header declares, entries with equal
+        collation keys keep the dictionary's order
+        """
+        self._load_keys()
+        key_text = self._key_list.key_text
+        collated = [self._collation_key(key_text(i)).encode('utf-8') for i in range(len(self._key_list))]
+        order = sorted(range(len(collated)), key=collated.__getitem__)
+        index = KeyList()
+        index.extend_keys(order, [collated[i] for i in order])
+        self._collation_index = index
+
+    def _load_keys(self):
+        """
+        decode all key blocks if they were skipped in lazy mode
+        """
+        if self._key_list is not None:
+            return
+        key_list = KeyList()
+        for n in range(len(self._key_block_decomp_sizes)):
+            key_list.extend(self._get_key_block(n))
+        self._key_list = key_list
+
+    def _get_key_block(self, n):
+        """
+        return the decoded n-th key block in lazy mode
+        """
+        key_block = self._key_block_cache.get(n)
+        if key_block is not None:
+            return key_block
+        f = self._open()
+        f.seek(self._key_block_comp_offsets[n])
+        key_block_compressed = f.read(self._key_block_comp_offsets[n+1] - self._key_block_comp_offsets[n])
+        f.close()
+        decompressed_size = self._key_block_decomp_sizes[n]
+        key_block = self._decompress_block(key_block_compressed, decompressed_size, 'key')
+        with self._timer('split_key_block'):
+            key_block = self._split_key_block(key_block)
+        self._key_block_cache.put(n, key_block, decompressed_size)
+        return key_block
+
+    def _get_key(self, index):
+        """
+        return (key_id, key_text) of key list entry index
+        """
+        if self._key_list is not None:
+            return self._key_list[index]
+        n = bisect_right(self._key_block_entry_offsets, index) - 1
+        return self._get_key_block(n)[index - self._key_block_entry_offsets[n]]
+
+    def _find_entry_lazy(self, key):
+        """
+        find key by bisecting the key block heads, which are sorted in the
+        dictionary's collation, as checked when the key block info was read
+        """
+        try:
+            collated = self._collation_key(key)
+        except UnicodeDecodeError:
+            # keys are utf-8, an invalid key is not one of them
+            return -1
+        last = bisect_right(self._key_block_heads_collated, collated) - 1
+        # equal keys may span several blocks, go back to the first one
+        first = last
+        while first > 0 and self._key_block_tails_collated[first-1] >= collated:
+            first -= 1
+        for n in range(max(first, 0), last + 1):
+            for j, (key_id, key_text) in enumerate(self._get_key_block(n)):
+                if key_text == key:
+                    return self._key_block_entry_offsets[n] + j
+        return -1
 
     def _read_number(self, f):
         return unpack(self._number_format, f.read(self._number_width))[0]
 
+    def _decompress_block(self, block_compressed, decompressed_size, kind='record'):
+        """
+        decompress one 'key' or 'record' block and verify its adler32 checksum
+        """
+        if self.stats is not None:
+            start = _clock()
+        # 4 bytes : compression type
+        block_type = block_compressed[:4]
+        # 4 bytes : adler32 checksum of decompressed block
+        adler32 = unpack('>I', block_compressed[4:8])[0]
+        if block_type == b'\x00\x00\x00\x00':
+            block = bytes(block_compressed[8:])
+        elif block_type == b'\x01\x00\x00\x00':
+            if lzo is None:
+                raise RuntimeError("LZO compression is not supported")
+            header = b'\xf0' + pack('>I', decompressed_size)
+            block = lzo.decompress(header + block_compressed[8:])
+        elif block_type == b'\x02\x00\x00\x00':
+            block = zlib.decompress(block_compressed[8:])
+        else:
+            raise RuntimeError("unknown block compression type %r" % block_type)
+        # notice that adler32 returns signed value
+        assert(adler32 == zlib.adler32(block) & 0xffffffff)
+        assert(len(block) == decompressed_size)
+        if self.stats is not None:
+            self.stats.add_time(kind + '_block_decompress', _clock() - start)
+            self.stats.add_block(kind, len(block_compressed), len(block))
+        return block
+
+    def _read_record_block_info(self):
+        """
+        read the record block info section once and store it as cumulative
+        offset tables, so that a record offset maps to its block by bisection
+        """
+        f = self._open()
+        f.seek(self._record_block_offset)
+
+        num_record_blocks = self._read_number(f)
+        num_entries = self._read_number(f)
+        assert(num_entries == self._num_entries)
+        record_block_info_size = self._read_number(f)
+        record_block_size = self._read_number(f)
+        assert(self._number_width * 2 * num_record_blocks == record_block_info_size)
+
+        record_block_info = f.read(record_block_info_size)
+        # file position of the first record block
+        record_block_data_offset = f.tell()
+        f.close()
+
+        # the i-th record block occupies
+        #   [comp_offsets[i], comp_offsets[i+1]) in file
+        #   [decomp_offsets[i], decomp_offsets[i+1]) in decompressed records
+        comp_offsets = array(_UINT64, [record_block_data_offset])
+        decomp_offsets = array(_UINT64, [0])
+        sizes = unpack('>%d%s' % (num_record_blocks * 2, self._number_format[1]), record_block_info)
+        for i in range(0, len(sizes), 2):
+            comp_offsets.append(comp_offsets[-1] + sizes[i])
+            decomp_offsets.append(decomp_offsets[-1] + sizes[i+1])
+        assert(comp_offsets[-1] - record_block_data_offset == record_block_size)
+
+        self._num_record_blocks = num_record_blocks
+        self._record_block_comp_offsets = comp_offsets
+        self._record_block_decomp_offsets = decomp_offsets
+
+    def _locate_record_block(self, record_offset):
+        """
+        return index of the record block holding the decompressed record offset
+        """
+        n = bisect_right(self._record_block_decomp_offsets, record_offset) - 1
+        if n < 0 or n >= self._num_record_blocks:
+            raise RuntimeError("record offset %d is out of range" % record_offset)
+        return n
+
+    def _read_record_block(self, f, n):
+        """
+        read and decompress the n-th record block from file f
+        """
+        comp_offsets = self._record_block_comp_offsets
+        decomp_offsets = self._record_block_decomp_offsets
+        f.seek(comp_offsets[n])
+        record_block_compressed = f.read(comp_offsets[n+1] - comp_offsets[n])
+        return self._decompress_block(record_block_compressed,
+                                      decomp_offsets[n+1] - decomp_offsets[n])
+
+    def _iter_record_blocks(self, workers=0):
+        """
+        generate (offset, record_block) for all record blocks in file order.
+        With workers > 1, compressed blocks are read ahead and decompressed
+        in a thread pool, keeping at most 2 * workers blocks in flight.
+        """
+        f = self._open()
+        if workers > 1 and ThreadPoolExecutor is None:
+            print("concurrent.futures is not available, decompress in one thread")
+            workers = 0
+        if workers <= 1:
+            for n in range(self._num_record_blocks):
+                yield self._record_block_decomp_offsets[n], self._read_record_block(f, n)
+            f.close()
+            return
+
+        comp_offsets = self._record_block_comp_offsets
+        decomp_offsets = self._record_block_decomp_offsets
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = []
+        try:
+            for n in range(self._num_record_blocks):
+                f.seek(comp_offsets[n])
+                record_block_compressed = f.read(comp_offsets[n+1] - comp_offsets[n])
+                pending.append((decomp_offsets[n], executor.submit(
+                    self._decompress_block, record_block_compressed, decomp_offsets[n+1] - decomp_offsets[n])))
+                if len(pending) >= 2 * workers:
+                    offset, future = pending.pop(0)
+                    yield offset, future.result()
+            for offset, future in pending:
+                yield offset, future.result()
+        finally:
+            for offset, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            f.close()
+
+    def _get_record_block(self, n, f=None):
+        """
+        return the n-th decompressed record block, from cache if possible,
+        otherwise read from f or a newly opened file
+        """
+        if self.cache is not None:
+            record_block = self.cache.get(n)
+            if record_block is not None:
+                return record_block
+        if f is None:
+            f = self._open()
+            record_block = self._read_record_block(f, n)
+            f.close()
+        else:
+            record_block = self._read_record_block(f, n)
+        if self.cache is not None:
+            self.cache.put(n, record_block)
+        return record_block
+
+    def _find_entry(self, key):
+        """
+        binary search for key, return its index in the key list or -1
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        if self._key_list is None:
+            return self._find_entry_lazy(key)
+        key_text = self._key_list.key_text
+        if self._sorted_index is None:
+            self._build_sorted_index()
+        order = self._sorted_index
+        lo = _bisect_left(lambda i: key_text(order[i]), len(order), key)
+        if lo < len(order) and key_text(order[lo]) == key:
+            return order[lo]
+        return -1
+
+    def _build_sorted_index(self):
+        # key list is in the dictionary's own collation order,
+        # which is not necessarily bytewise, so sort an index of it once
+        self._sorted_index = array('I', sorted(range(len(self._key_list)), key=self._key_list.key_text))
+
+    def _index_metadata(self):
+        """
+        metadata tying an index file to the current state of the source file
+        """
+        st = os.stat(self._fname)
+        return {
+            'version': _INDEX_VERSION,
+            'byteorder': sys.byteorder,
+            'source_size': st.st_size,
+            'source_mtime': st.st_mtime,
+            'header_adler32': self._header_adler32,
+            'encoding': self._encoding,
+        }
+
+    def _save_index(self, path):
+        """
+        write key list, sorted lookup index and record block table to path
+        """
+        self._load_keys()
+        if self._sorted_index is None:
+            self._build_sorted_index()
+        if self._collation_index is None:
+            self._build_collation_index()
+        key_list = self._key_list
+        collation_index = self._collation_index
+        sections = [
+            ('key_ids', 'Q', key_list.key_ids),
+            ('text_offsets', 'Q', key_list.text_offsets),
+            ('texts', 'B', key_list.texts),
+            ('sorted_index', 'I', self._sorted_index),
+            ('collation_entries', 'Q', collation_index.key_ids),
+            ('collation_offsets', 'Q', collation_index.text_offsets),
+            ('collation_texts', 'B', collation_index.texts),
+            ('record_block_comp_offsets', 'Q', self._record_block_comp_offsets),
+            ('record_block_decomp_offsets', 'Q', self._record_block_decomp_offsets),
+        ]
+        meta = self._index_metadata()
+        meta['num_entries'] = self._num_entries
+        meta['num_record_blocks'] = self._num_record_blocks
+        meta['record_block_offset'] = self._record_block_offset
+        # section offsets are relative to the end of metadata
+        meta['sections'] = {}
+        offset = 0
+        for name, typecode, data in sections:
+            size = len(data) * array(typecode).itemsize
+            meta['sections'][name] = [offset, size, typecode]
+            offset += (size + 7) // 8 * 8
+
+        meta_bytes = json.dumps(meta, sort_keys=True).encode('utf-8')
+        # keep sections 8-byte aligned
+        meta_bytes += b' ' * (-(len(_INDEX_MAGIC) + 4 + len(meta_bytes)) % 8)
+        tmp_path = path + '.tmp'
+        try:
+            f = open(tmp_path, 'wb')
+            f.write(_INDEX_MAGIC)
+            f.write(pack('<I', len(meta_bytes)))
+            f.write(meta_bytes)
+            for name, typecode, data in sections:
+                data = memoryview(data).cast('B')
+                f.write(data)
+                f.write(b'\x00' * (-len(data) % 8))
+            f.close()
+            os.replace(tmp_path, path)
+        except (IOError, OSError) as e:
+            print("Failed to write index file %s: %s" % (path, e))
+
+    def _load_index(self, path):
+        """
+        map the index file at path, return False if it is missing or stale
+        """
+        try:
+            f = open(path, 'rb')
+        except (IOError, OSError):
+            return False
+        try:
+            index_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            # empty file
+            f.close()
+            return False
+        f.close()
+
+        try:
+            if index_mmap[:len(_INDEX_MAGIC)] != _INDEX_MAGIC:
+                raise ValueError('not an index file')
+            meta_size = unpack('<I', index_mmap[len(_INDEX_MAGIC):len(_INDEX_MAGIC)+4])[0]
+            meta_start = len(_INDEX_MAGIC) + 4
+            meta = json.loads(index_mmap[meta_start:meta_start+meta_size].decode('utf-8'))
+            current = self._index_metadata()
+            for name in current:
+                if meta.get(name) != current[name]:
+                    raise ValueError('stale index')
+            view = memoryview(index_mmap)
+            data_start = meta_start + meta_size
+            sections = {}
+            for name, (offset, size, typecode) in meta['sections'].items():
+                start = data_start + offset
+                if start + size > len(index_mmap):
+                    raise ValueError('truncated index')
+                sections[name] = view[start:start+size].cast(typecode)
+        except (ValueError, KeyError, TypeError):
+            # release the views of the mapping before closing it
+            sections = view = None
+            try:
+                index_mmap.close()
+            except BufferError:
+                pass
+            return False
+
+        self._index_mmap = index_mmap
+        self._num_entries = meta['num_entries']
+        self._record_block_offset = meta['record_block_offset']
+        self._num_record_blocks = meta['num_record_blocks']
+        self._key_list = KeyList(sections['key_ids'], sections['text_offsets'], sections['texts'])
+        self._sorted_index = sections['sorted_index']
+        self._collation_index = KeyList(sections['collation_entries'], sections['collation_offsets'],
+                                        sections['collation_texts'])
+        self._record_block_comp_offsets = sections['record_block_comp_offsets']
+        self._record_block_decomp_offsets = sections['record_block_decomp_offsets']
+        return True
+
+    def _record_range(self, index):
+        """
+        return (n, start, end) locating the record of key list entry index
+        in the n-th record block
+        """
+        record_start = self._get_key(index)[0]
+        n = self._locate_record_block(record_start)
+        offset = self._record_block_decomp_offsets[n]
+        record_end = self._record_block_decomp_offsets[n+1]
+        if index < self._num_entries - 1:
+            record_end = min(record_end, self._get_key(index+1)[0])
+        return n, record_start - offset, record_end - offset
+
+    def _record_checksum(self, index):
+        """
+        return (n, adler32, start, end) locating the record of key list entry
+        index in the n-th record block, whose adler32 checksum is read from
+        the block prefix without decompressing it
+        """
+        n, start, end = self._record_range(index)
+        f = self._open()
+        # skip 4 bytes compression type
+        f.seek(self._record_block_comp_offsets[n] + 4)
+        adler32 = unpack('>I', f.read(4))[0]
+        f.close()
+        return n, adler32, start, end
+
+    def _read_record(self, index, zero_copy=False):
+        """
+        read the raw record of key list entry index,
+        decompressing only the record block holding it.
+        With zero_copy the record is a memoryview into the record block.
+        """
+        n, start, end = self._record_range(index)
+        record_block = self._get_record_block(n)
+        if zero_copy:
+            record_block = memoryview(record_block)
+        return record_block[start:end]
+
+    def _read_records(self, indexes, zero_copy=False):
+        """
+        read the raw records of key list entries indexes, None for negative
+        ones, reading each record block needed once and in file order
+        """
+        records = [None] * len(indexes)
+        # record block number -> [(position in records, start, end)]
+        ranges = {}
+        for i, index in enumerate(indexes):
+            if index >= 0:
+                n, start, end = self._record_range(index)
+                ranges.setdefault(n, []).append((i, start, end))
+        f = self._open()
+        for n in sorted(ranges):
+            record_block = self._get_record_block(n, f)
+            if zero_copy:
+                record_block = memoryview(record_block)
+            for i, start, end in ranges[n]:
+                records[i] = record_block[start:end]
+        f.close()
+        return records
+
+    def _lookup_records(self, keys, normalize=False, zero_copy=False):
+        indexes = [self._find_key(key, normalize) for key in keys]
+        return self._read_records(indexes, zero_copy)
+
+    def _find_entry_normalized(self, key):
+        """
+        return index of the first entry whose collation key equals
+        that of key, or -1
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        if self._collation_index is None:
+            self._build_collation_index()
+        index = self._collation_index
+        try:
+            collated = self._collation_key(key).encode('utf-8')
+        except UnicodeDecodeError:
+            # keys are utf-8, an invalid key is not one of them
+            return -1
+        lo = _bisect_left(index.key_text, len(index), collated)
+        if lo < len(index) and index.key_text(lo) == collated:
+            return index.key_ids[lo]
+        return -1
+
+    def _find_key(self, key, normalize=False):
+        """
+        return index of key, or with normalize of the first entry equal to it
+        under the dictionary's collation if there is no exact match, or -1
+        """
+        index = self._find_entry(key)
+        if index < 0 and normalize:
+            index = self._find_entry_normalized(key)
+        return index
+
+    def _lookup_record(self, key, normalize=False, zero_copy=False):
+        index = self._find_key(key, normalize)
+        if index < 0:
+            raise KeyError(key)
+        return self._read_record(index, zero_copy)
+
     def _parse_header(self, header):
         """
         extract attributes from <Dict attr="value" ... >
@@ -134,12 +1057,15 @@ class MDict(object):
             assert(key_block_info_compressed[:4] == b'\x02\x00\x00\x00')
             # decrypt if needed
             if self._encrypt & 0x02:
-                key_block_info_compressed = _mdx_decrypt(key_block_info_compressed)
+                with self._timer('decrypt'):
+                    key_block_info_compressed = _mdx_decrypt(key_block_info_compressed)
             # decompress
             key_block_info = zlib.decompress(key_block_info_compressed[8:])
             # adler checksum
             adler32 = unpack('>I', key_block_info_compressed[4:8])[0]
             assert(adler32 == zlib.adler32(key_block_info) & 0xffffffff)
+            if self.stats is not None:
+                self.stats.add_adler32_check()
         else:
             # no compression
             key_block_info = key_block_info_compressed
@@ -156,42 +1082,55 @@ class MDict(object):
             byte_width = 1
             text_term = 0
 
+        if self._encoding != 'UTF-16':
+            char_width = 1
+        else:
+            char_width = 2
+
+        # first and last key of each key block, and its number of entries
+        key_block_heads = []
+        key_block_tails = []
+        key_block_num_entries = []
+        number_format = self._number_format
+        number_width = self._number_width
         while i < len(key_block_info):
             # number of entries in current key block
-            num_entries += unpack(self._number_format, key_block_info[i:i+self._number_width])[0]
-            i += self._number_width
+            block_num_entries = unpack_from(number_format, key_block_info, i)[0]
+            num_entries += block_num_entries
+            i += number_width
             # text head size
-            text_head_size = unpack(byte_format, key_block_info[i:i+byte_width])[0]
+            text_head_size = unpack_from(byte_format, key_block_info, i)[0]
             i += byte_width
             # text head
-            if self._encoding != 'UTF-16':
-                i += text_head_size + text_term
-            else:
-                i += (text_head_size + text_term) * 2
+            key_block_heads += [self._decode_key_text(key_block_info[i:i+text_head_size*char_width])]
+            i += (text_head_size + text_term) * char_width
             # text tail size
-            text_tail_size = unpack(byte_format, key_block_info[i:i+byte_width])[0]
+            text_tail_size = unpack_from(byte_format, key_block_info, i)[0]
             i += byte_width
             # text tail
-            if self._encoding != 'UTF-16':
-                i += text_tail_size + text_term
-            else:
-                i += (text_tail_size + text_term) * 2
-            # key block compressed size
-            key_block_compressed_size = unpack(self._number_format, key_block_info[i:i+self._number_width])[0]
-            i += self._number_width
-            # key block decompressed size
-            key_block_decompressed_size = unpack(self._number_format, key_block_info[i:i+self._number_width])[0]
-            i += self._number_width
+            key_block_tails += [self._decode_key_text(key_block_info[i:i+text_tail_size*char_width])]
+            i += (text_tail_size + text_term) * char_width
+            # key block compressed size and decompressed size
+            key_block_compressed_size, key_block_decompressed_size = \
+                unpack_from(number_format[0] + number_format[1] * 2, key_block_info, i)
+            i += number_width * 2
             key_block_info_list += [(key_block_compressed_size, key_block_decompressed_size)]
+            key_block_num_entries += [block_num_entries]
 
         #assert(num_entries == self._num_entries)
+        self._key_block_heads = key_block_heads
+        self._key_block_tails = key_block_tails
+        self._key_block_num_entries = key_block_num_entries
 
         return key_block_info_list
 
     def _decode_key_block(self, key_block_compressed, key_block_info_list):
-        key_list = []
+        key_list = KeyList()
         i = 0
+        stats = self.stats
         for compressed_size, decompressed_size in key_block_info_list:
+            if stats is not None:
+                started = _clock()
             start = i
             end = i + compressed_size
             # 4 bytes : compression type
@@ -199,7 +1138,7 @@ class MDict(object):
             # 4 bytes : adler checksum of decompressed key block
             adler32 = unpack('>I', key_block_compressed[start+4:start+8])[0]
             if key_block_type == b'\x00\x00\x00\x00':
-                key_block = key_block_compressed[start+8:end]
+                key_block = bytes(key_block_compressed[start+8:end])
             elif key_block_type == b'\x01\x00\x00\x00':
                 if lzo is None:
                     print("LZO compression is not supported")
@@ -210,53 +1149,98 @@ class MDict(object):
             elif key_block_type == b'\x02\x00\x00\x00':
                 # decompress key block
                 key_block = zlib.decompress(key_block_compressed[start+8:end])
-            # extract one single key block into a key list
-            key_list += self._split_key_block(key_block)
             # notice that adler32 returns signed value
             assert(adler32 == zlib.adler32(key_block) & 0xffffffff)
+            if stats is not None:
+                stats.add_time('key_block_decompress', _clock() - started)
+                stats.add_block('key', compressed_size, len(key_block))
+            # extract one single key block into a key list
+            with self._timer('split_key_block'):
+                self._split_key_block(key_block, key_list)
 
             i += compressed_size
         return key_list
 
-    def _split_key_block(self, key_block):
-        key_list = []
+    def _decode_key_text(self, text):
+        return bytes(text).decode(self._encoding, errors='ignore').encode('utf-8').strip()
+
+    def _collation_key(self, key_text):
+        """
+        sort key of key_text in the dictionary's declared collation,
+        see KeyCaseSensitive and StripKey header attributes
+        """
+        text = key_text.decode('utf-8')
+        if self._strip_key:
+            text = _STRIP_KEY_PATTERN.sub(u'', text)
+        if not self._key_case_sensitive:
+            text = _casefold(text)
+        return text
+
+    def _split_key_block(self, key_block, key_list=None):
+        """
+        split one decompressed key block, appending its keys to key_list
+        """
+        if key_list is None:
+            key_list = KeyList()
+        # key text ends with '\x00'
+        if self._encoding == 'UTF-16':
+            delimiter = b'\x00\x00'
+            width = 2
+        else:
+            delimiter = b'\x00'
+            width = 1
+        number_format = self._number_format
+        number_width = self._number_width
+        find = key_block.find
+        block_size = len(key_block)
+        key_ids = []
+        key_texts = []
         key_start_index = 0
-        while key_start_index < len(key_block):
+        while key_start_index < block_size:
             # the corresponding record's offset in record block
-            key_id = unpack(self._number_format, key_block[key_start_index:key_start_index+self._number_width])[0]
-            # key text ends with '\x00'
-            if self._encoding == 'UTF-16':
-                delimiter = b'\x00\x00'
-                width = 2
-            else:
-                delimiter = b'\x00'
-                width = 1
-            i = key_start_index + self._number_width
-            while i < len(key_block):
-                if key_block[i:i+width] == delimiter:
-                    key_end_index = i
-                    break
-                i += width
-            key_text = key_block[key_start_index+self._number_width:key_end_index]\
-                .decode(self._encoding, errors='ignore').encode('utf-8').strip()
+            key_ids.append(unpack_from(number_format, key_block, key_start_index)[0])
+            text_start = key_start_index + number_width
+            key_end_index = find(delimiter, text_start)
+            # utf-16 terminator must be aligned on a character boundary
+            while width == 2 and key_end_index != -1 and (key_end_index - text_start) % 2:
+                key_end_index = find(delimiter, key_end_index + 1)
+            if key_end_index == -1:
+                key_end_index = block_size
+            key_texts.append(key_block[text_start:key_end_index])
             key_start_index = key_end_index + width
-            key_list += [(key_id, key_text)]
+
+        key_list.extend_keys(key_ids, self._decode_key_texts(key_texts, delimiter))
         return key_list
 
+    def _decode_key_texts(self, key_texts, delimiter):
+        """
+        decode raw key texts to stripped utf-8 in one pass,
+        joined by their terminator which can not occur inside a key
+        """
+        joined = delimiter.join(key_texts).decode(self._encoding, errors='ignore')
+        texts = joined.encode('utf-8').split(b'\x00')
+        if len(texts) != len(key_texts):
+            # an undecodable sequence swallowed a terminator, go one by one
+            return [self._decode_key_text(text) for text in key_texts]
+        return list(map(bytes.strip, texts))
+
     def _read_header(self):
-        f = open(self._fname, 'rb')
+        f = self._open()
         # number of bytes of header text
         header_bytes_size = unpack('>I', f.read(4))[0]
         header_bytes = f.read(header_bytes_size)
         # 4 bytes: adler32 checksum of header, in little endian
         adler32 = unpack('<I', f.read(4))[0]
         assert(adler32 == zlib.adler32(header_bytes) & 0xffffffff)
+        if self.stats is not None:
+            self.stats.add_adler32_check()
+        self._header_adler32 = adler32
         # mark down key block offset
         self._key_block_offset = f.tell()
         f.close()
 
         # header text in utf-16 encoding ending with '\x00\x00'
-        header_text = header_bytes[:-2].decode('utf-16').encode('utf-8')
+        header_text = bytes(header_bytes[:-2]).decode('utf-16').encode('utf-8')
         header_tag = self._parse_header(header_text)
         if not self._encoding:
             encoding = header_tag[b'Encoding']
@@ -277,17 +1261,22 @@ class MDict(object):
         else:
             self._encrypt = int(header_tag[b'Encrypted'])
 
+        # key comparison rules, MDict compares keys case insensitively
+        # and ignoring punctuation and spaces unless told otherwise
+        self._key_case_sensitive = header_tag.get(b'KeyCaseSensitive') == b'Yes'
+        self._strip_key = header_tag.get(b'StripKey', b'Yes') == b'Yes'
+
         # stylesheet attribute if present takes form of:
         #   style_number # 1-255
         #   style_begin  # or ''
         #   style_end    # or ''
         # store stylesheet in dict in the form of
-        # {'number' : ('style_begin', 'style_end')}
+        # {b'number' : (b'style_begin', b'style_end')}
         self._stylesheet = {}
-        if header_tag.get('StyleSheet'):
-            lines = header_tag['StyleSheet'].splitlines()
-            for i in range(0, len(lines), 3):
-                self._stylesheet[lines[i]] = (lines[i+1], lines[i+2])
+        if header_tag.get(b'StyleSheet'):
+            lines = header_tag[b'StyleSheet'].splitlines()
+            for i in range(0, len(lines) - 2, 3):
+                self._stylesheet[lines[i].strip()] = (lines[i+1], lines[i+2])
 
         # before version 2.0, number is 4 bytes integer
         # version 2.0 and above uses 8 bytes
@@ -302,7 +1291,7 @@ class MDict(object):
         return header_tag
 
     def _read_keys(self):
-        f = open(self._fname, 'rb')
+        f = self._open()
         f.seek(self._key_block_offset)
 
         # the following numbers could be encrypted
@@ -310,7 +1299,7 @@ class MDict(object):
             num_bytes = 8 * 5
         else:
             num_bytes = 4 * 4
-        block = f.read(num_bytes)
+        block = bytes(f.read(num_bytes))
 
         if self._encrypt & 1:
             if self._passcode is None:
@@ -322,7 +1311,8 @@ class MDict(object):
                 encrypted_key = _decrypt_regcode_by_email(regcode, userid)
             else:
                 encrypted_key = _decrypt_regcode_by_deviceid(regcode, userid)
-            block = _salsa_decrypt(block, encrypted_key)
+            with self._timer('decrypt'):
+                block = _salsa_decrypt(block, encrypted_key)
 
         # decode this block
         sf = BytesIO(block)
@@ -337,17 +1327,49 @@ class MDict(object):
         key_block_info_size = self._read_number(sf)
         # number of bytes of key block
         key_block_size = self._read_number(sf)
+        # garbage numbers, e.g. still encrypted, would read the rest of the file
+        if self._key_block_offset + num_bytes + key_block_info_size + key_block_size > \
+                os.path.getsize(self._fname):
+            raise RuntimeError('key block sizes exceed the file size')
 
         # 4 bytes: adler checksum of previous 5 numbers
         if self._version >= 2.0:
             adler32 = unpack('>I', f.read(4))[0]
             assert adler32 == (zlib.adler32(block) & 0xffffffff)
+            if self.stats is not None:
+                self.stats.add_adler32_check()
 
         # read key block info, which indicates key block's compressed and decompressed size
         key_block_info = f.read(key_block_info_size)
-        key_block_info_list = self._decode_key_block_info(key_block_info)
+        with self._timer('key_block_info'):
+            key_block_info_list = self._decode_key_block_info(key_block_info)
         assert(num_key_blocks == len(key_block_info_list))
 
+        if self._lazy:
+            heads = [self._collation_key(k) for k in self._key_block_heads]
+            tails = [self._collation_key(k) for k in self._key_block_tails]
+            # lazy lookups bisect the key blocks, which needs them sorted in
+            # the guessed collation, otherwise decode all keys
+            bounds = [bound for head_tail in zip(heads, tails) for bound in head_tail]
+            if any(bounds[i] > bounds[i+1] for i in range(len(bounds) - 1)):
+                self._lazy = False
+        if self._lazy:
+            # only remember where each key block is, keys are decoded on demand
+            key_block_offset = f.tell()
+            self._key_block_comp_offsets = array(_UINT64, [key_block_offset])
+            self._key_block_entry_offsets = array(_UINT64, [0])
+            for (compressed_size, decompressed_size), block_num_entries in \
+                    zip(key_block_info_list, self._key_block_num_entries):
+                self._key_block_comp_offsets.append(self._key_block_comp_offsets[-1] + compressed_size)
+                self._key_block_entry_offsets.append(self._key_block_entry_offsets[-1] + block_num_entries)
+            self._key_block_decomp_sizes = array(_UINT64, [d for c, d in key_block_info_list])
+            assert(self._key_block_comp_offsets[-1] - key_block_offset == key_block_size)
+            self._key_block_heads_collated = heads
+            self._key_block_tails_collated = tails
+            self._record_block_offset = key_block_offset + key_block_size
+            f.close()
+            return None
+
         # read key block
         key_block_compressed = f.read(key_block_size)
         # extract key block
@@ -359,50 +1381,113 @@ class MDict(object):
         return key_list
 
     def _read_keys_brutal(self):
-        f = open(self._fname, 'rb')
-        f.seek(self._key_block_offset)
-
-        # the following numbers could be encrypted, disregard them!
-        if self._version >= 2.0:
-            num_bytes = 8 * 5 + 4
-            key_block_type = b'\x02\x00\x00\x00'
+        """
+        find the key blocks when the numbers preceding the key block info are
+        unreadable, e.g. encrypted without passcode, in the memory mapped file.
+        The key blocks start with a block type right after the key block info,
+        and end where the record section starts, whose number of entries must
+        match the key block info.
+        """
+        if self._mmap is not None:
+            data = self._mmap
+            mapping = None
         else:
-            num_bytes = 4 * 4
-            key_block_type = b'\x01\x00\x00\x00'
-        block = f.read(num_bytes)
-
-        # key block info
-        # 4 bytes '\x02\x00\x00\x00'
-        # 4 bytes adler32 checksum
-        # unknown number of bytes follows until '\x02\x00\x00\x00' which marks the beginning of key block
-        key_block_info = f.read(8)
-        if self._version >= 2.0:
-            assert key_block_info[:4] == b'\x02\x00\x00\x00'
-        while True:
-            fpos = f.tell()
-            t = f.read(1024)
-            index = t.find(key_block_type)
-            if index != -1:
-                key_block_info += t[:index]
-                f.seek(fpos + index)
-                break
+            with open(self._fname, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = mapping
+        try:
+            # the following numbers could be encrypted, disregard them!
+            if self._version >= 2.0:
+                info_start = self._key_block_offset + 8 * 5 + 4
+                key_block_offset = self._find_key_blocks_v2(data, info_start)
             else:
-                key_block_info += t
-
-        key_block_info_list = self._decode_key_block_info(key_block_info)
-        key_block_size = sum(list(zip(*key_block_info_list))[0])
-
-        # read key block
-        key_block_compressed = f.read(key_block_size)
+                info_start = self._key_block_offset + 4 * 4
+                key_block_offset = self._find_key_blocks_v1(data, info_start)
+            if key_block_offset is None:
+                raise RuntimeError('cannot locate the key blocks')
+            key_block_info_list = self._decode_key_block_info(data[info_start:key_block_offset])
+            self._record_block_offset = key_block_offset + sum(c for c, d in key_block_info_list)
+            key_block_compressed = data[key_block_offset:self._record_block_offset]
+        finally:
+            if mapping is not None:
+                mapping.close()
         # extract key block
         key_list = self._decode_key_block(key_block_compressed, key_block_info_list)
-
-        self._record_block_offset = f.tell()
-        f.close()
-
         self._num_entries = len(key_list)
         return key_list
 
+    def _find_key_blocks_v2(self, data, info_start):
+        """
+        return the offset of the key blocks after the compressed key block
+        info starting at info_start: scan for block types with bytes.find,
+        in file order, and validate each candidate boundary by decoding the
+        key block info before it, adler32 checksum included
+        """
+        # key block info
+        # 4 bytes '\x02\x00\x00\x00'
+        # 4 bytes adler32 checksum
+        # unknown number of bytes follows until the key block type
+        assert data[info_start:info_start+4] == b'\x02\x00\x00\x00'
+        candidates = {}
+        for block_type in (b'\x00\x00\x00\x00', b'\x01\x00\x00\x00', b'\x02\x00\x00\x00'):
+            candidates[block_type] = data.find(block_type, info_start + 8)
+        while True:
+            found = [(pos, block_type) for block_type, pos in candidates.items() if pos >= 0]
+            if not found:
+                return None
+            pos, block_type = min(found)
+            try:
+                key_block_info_list = self._decode_key_block_info(data[info_start:pos])
+            except Exception:
+                key_block_info_list = None
+            if key_block_info_list and self._is_record_section(
+                    data, pos + sum(c for c, d in key_block_info_list), sum(self._key_block_num_entries)):
+                return pos
+            candidates[block_type] = data.find(block_type, pos + 1)
+
+    def _find_key_blocks_v1(self, data, info_start):
+        """
+        return the offset of the key blocks after the uncompressed key block
+        info starting at info_start: walk its entries in one pass, any entry
+        may be the last one
+        """
+        char_width = 2 if self._encoding == 'UTF-16' else 1
+        number_format = '>' + self._number_format[1]
+        i = info_start
+        num_entries = 0
+        key_block_size = 0
+        try:
+            while i < len(data):
+                # number of entries, text head, text tail, compressed and decompressed size
+                num_entries += unpack_from(number_format, data, i)[0]
+                i += 4
+                i += 1 + unpack_from('>B', data, i)[0] * char_width
+                i += 1 + unpack_from('>B', data, i)[0] * char_width
+                key_block_size += unpack_from(number_format, data, i)[0]
+                i += 8
+                if data[i:i+4] in (b'\x00\x00\x00\x00', b'\x01\x00\x00\x00', b'\x02\x00\x00\x00') and \
+                        self._is_record_section(data, i + key_block_size, num_entries):
+                    return i
+        except struct_error:
+            pass
+        return None
+
+    def _is_record_section(self, data, offset, num_entries):
+        """
+        whether the record section of a dictionary of num_entries entries
+        may start at offset
+        """
+        number_width = self._number_width
+        if offset + 4 * number_width > len(data):
+            return False
+        # number of record blocks, number of entries,
+        # size of record block info, size of record blocks
+        num_record_blocks, record_num_entries, record_block_info_size, record_block_size = \
+            unpack_from('>4' + self._number_format[1], data, offset)
+        return record_num_entries == num_entries and \
+            record_block_info_size == 2 * number_width * num_record_blocks and \
+            offset + 4 * number_width + record_block_info_size + record_block_size <= len(data)
+
 
 class MDD(MDict):
     """
@@ -413,80 +1498,155 @@ class MDD(MDict):
     >>> for filename,content in mdd.items():
     ... print filename, content[:10]
     """
-    def __init__(self, fname, passcode=None):
-        MDict.__init__(self, fname, encoding='UTF-16', passcode=passcode)
-
-    def items(self):
+    def __init__(self, fname, passcode=None, cache_size=0, use_mmap=False, lazy=False, index=False,
+                 casefold_paths=False, stats=None):
+        self._casefold_paths = casefold_paths
+        self._resource_index = None
+        MDict.__init__(self, fname, encoding='UTF-16', passcode=passcode,
+                       cache_size=cache_size, use_mmap=use_mmap, lazy=lazy, index=index, stats=stats)
+
+    def items(self, workers=0, zero_copy=False):
         """Return a generator which in turn produce tuples in the form of (filename, content)
+        With workers > 1, record blocks are decompressed in a pool of that many threads.
+        With zero_copy, content is a memoryview into its decompressed record block
+        instead of a copy, valid as long as it is referenced.
+        """
+        return self._decode_record_block(workers, zero_copy)
+
+    def lookup(self, path, normalize=False, zero_copy=False):
+        """Return the content of the file at path, e.g. '\\img\\a.png'.
+        Only the record block holding it is read and decompressed.
+        With normalize, fall back to the first path equal to it under the
+        dictionary's collation if there is no exact match.
+        With zero_copy, return a memoryview into the record block.
+        Raise KeyError if path is not found.
         """
-        return self._decode_record_block()
+        return self._lookup_record(path, normalize, zero_copy)
 
-    def _decode_record_block(self):
-        f = open(self._fname, 'rb')
-        f.seek(self._record_block_offset)
+    def lookup_many(self, paths, normalize=False, zero_copy=False):
+        """Return a list of contents of the files at paths, in the same order,
+        None for paths not found. Each record block needed is read and
+        decompressed only once.
+        """
+        return self._lookup_records(paths, normalize, zero_copy)
 
-        num_record_blocks = self._read_number(f)
-        num_entries = self._read_number(f)
-        assert(num_entries == self._num_entries)
-        record_block_info_size = self._read_number(f)
-        record_block_size = self._read_number(f)
+    def entry(self, index, zero_copy=False):
+        """Return (filename, content) of the index-th file in dictionary order.
+        """
+        return self._get_key(index)[1], self._read_record(index, zero_copy)
+
+    def get_resource(self, url_path, zero_copy=False):
+        """Return the content of the file referred to by url_path as written in
+        definitions, e.g. 'sound://foo.mp3', '/img/a.png' or 'img/a.png'.
+        Paths are compared with forward slashes and no leading separator,
+        ignoring case if the MDD was opened with casefold_paths.
+        Only the record block holding it is read and decompressed.
+        Raise KeyError if url_path is not found.
+        """
+        index = self._find_resource(url_path)
+        if index < 0:
+            raise KeyError(url_path)
+        return self._read_record(index, zero_copy)
 
-        # record block info section
-        record_block_info_list = []
-        size_counter = 0
-        for i in range(num_record_blocks):
-            compressed_size = self._read_number(f)
-            decompressed_size = self._read_number(f)
-            record_block_info_list += [(compressed_size, decompressed_size)]
-            size_counter += self._number_width * 2
-        assert(size_counter == record_block_info_size)
+    def _find_resource(self, url_path):
+        """
+        binary search for the normalized url_path, return its index
+        in the key list or -1
+        """
+        if self._resource_index is None:
+            self._build_resource_index()
+        index = self._resource_index
+        path = self._normalize_path(url_path)
+        lo = _bisect_left(index.key_text, len(index), path)
+        if lo < len(index) and index.key_text(lo) == path:
+            return index.key_ids[lo]
+        return -1
+
+    def _normalize_path(self, path):
+        """
+        resource path as utf-8 bytes with forward slashes, without scheme
+        and leading separators, casefolded if casefold_paths is set
+        """
+        if not isinstance(path, unicode):
+            path = path.decode('utf-8')
+        scheme = path.find(u'://')
+        if scheme >= 0:
+            path = path[scheme+3:]
+        path = path.replace(u'\\', u'/').lstrip(u'/')
+        if self._casefold_paths:
+            path = _casefold(path)
+        return path.encode('utf-8')
+
+    def _build_resource_index(self):
+        """
+        normalized path index: entry numbers sorted by normalized path,
+        entries with equal normalized paths keep the dictionary's order
+        """
+        self._load_keys()
+        key_text = self._key_list.key_text
+        paths = [self._normalize_path(key_text(i)) for i in range(len(self._key_list))]
+        order = sorted(range(len(paths)), key=paths.__getitem__)
+        index = KeyList()
+        index.extend_keys(order, [paths[i] for i in order])
+        self._resource_index = index
+
+    def _decode_record_block(self, workers=0, zero_copy=False):
+        self._load_keys()
+        key_list = self._key_list
+        key_ids = key_list.key_ids
+        num_entries = len(key_ids)
 
         # actual record block
-        offset = 0
         i = 0
-        size_counter = 0
-        for compressed_size, decompressed_size in record_block_info_list:
-            record_block_compressed = f.read(compressed_size)
-            # 4 bytes: compression type
-            record_block_type = record_block_compressed[:4]
-            # 4 bytes: adler32 checksum of decompressed record block
-            adler32 = unpack('>I', record_block_compressed[4:8])[0]
-            if record_block_type == b'\x00\x00\x00\x00':
-                record_block = record_block_compressed[8:]
-            elif record_block_type == b'\x01\x00\x00\x00':
-                if lzo is None:
-                    print("LZO compression is not supported")
-                    break
-                # decompress
-                header = b'\xf0' + pack('>I', decompressed_size)
-                record_block = lzo.decompress(header + record_block_compressed[8:])
-            elif record_block_type == b'\x02\x00\x00\x00':
-                # decompress
-                record_block = zlib.decompress(record_block_compressed[8:])
-
-            # notice that adler32 return signed value
-            assert(adler32 == zlib.adler32(record_block) & 0xffffffff)
-
-            assert(len(record_block) == decompressed_size)
+        for offset, record_block in self._iter_record_blocks(workers):
+            if zero_copy:
+                record_block = memoryview(record_block)
             # split record block according to the offset info from key block
-            while i < len(self._key_list):
-                record_start, key_text = self._key_list[i]
+            while i < num_entries:
+                record_start = key_ids[i]
                 # reach the end of current record block
                 if record_start - offset >= len(record_block):
                     break
                 # record end index
-                if i < len(self._key_list)-1:
-                    record_end = self._key_list[i+1][0]
+                if i < num_entries-1:
+                    record_end = key_ids[i+1]
                 else:
                     record_end = len(record_block) + offset
+                key_text = key_list.key_text(i)
                 i += 1
                 data = record_block[record_start-offset:record_end-offset]
                 yield key_text, data
-            offset += len(record_block)
-            size_counter += compressed_size
-        assert(size_counter == record_block_size)
 
-        f.close()
+
+class LazyRecord(object):
+    """
+    Raw record of a MDX, transcoded only when accessed:
+    raw as stored, utf8 as returned by MDX.lookup(), text as unicode.
+    """
+    __slots__ = ('_mdx', 'raw')
+
+    def __init__(self, mdx, raw):
+        self._mdx = mdx
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def utf8(self):
+        return self._mdx._treat_record_data(self.raw)
+
+    @property
+    def text(self):
+        return self._mdx._record_text(self.raw)
+
+    def __bytes__(self):
+        return self.utf8
+
+    def __str__(self):
+        if sys.hexversion >= 0x03000000:
+            return self.text
+        return self.utf8
 
 
 class MDX(MDict):
@@ -498,103 +1658,145 @@ class MDX(MDict):
     >>> for key,value in mdx.items():
     ... print key, value[:10]
     """
-    def __init__(self, fname, encoding='', substyle=False, passcode=None):
-        MDict.__init__(self, fname, encoding, passcode)
+    def __init__(self, fname, encoding='', substyle=False, passcode=None, cache_size=0, use_mmap=False,
+                 lazy=False, index=False, stats=None):
+        MDict.__init__(self, fname, encoding, passcode, cache_size, use_mmap, lazy, index, stats)
         self._substyle = substyle
+        # style begin and end by style number, for _substitute_stylesheet
+        self._style_begins = dict((number, style[0]) for number, style in self._stylesheet.items())
+        self._style_ends = dict((number, style[1]) for number, style in self._stylesheet.items())
+        # records of utf-8 dictionaries need no transcoding
+        self._utf8 = codecs.lookup(self._encoding).name == 'utf-8'
 
-    def items(self):
+    def items(self, workers=0, decode='utf8'):
         """Return a generator which in turn produce tuples in the form of (key, value)
+        With workers > 1, record blocks are decompressed in a pool of that many threads.
+        decode selects the values:
+            'utf8'  utf-8 encoded strings, as returned by lookup()
+            'raw'   records as stored, in the dictionary's encoding with their NUL terminator
+            'str'   unicode strings
+            'lazy'  LazyRecord objects, transcoding a record only when it is accessed
         """
-        return self._decode_record_block()
-
-    def _substitute_stylesheet(self, txt):
-        # substitute stylesheet definition
-        txt_list = re.split('`\d+`', txt)
-        txt_tag = re.findall('`\d+`', txt)
-        txt_styled = txt_list[0]
-        for j, p in enumerate(txt_list[1:]):
-            style = self._stylesheet[txt_tag[j][1:-1]]
-            if p and p[-1] == '\n':
-                txt_styled = txt_styled + style[0] + p.rstrip() + style[1] + '\r\n'
-            else:
-                txt_styled = txt_styled + style[0] + p + style[1]
-        return txt_styled
+        # raise on a bad decode now, not on the first item
+        treat = self._record_decoder(decode)
+        return self._decode_record_block(workers, treat)
+
+    def lookup(self, key, normalize=False):
+        """Return the definition of key as utf-8 encoded string.
+        Only the record block holding it is read and decompressed.
+        With normalize, fall back to the first key equal to it under the
+        dictionary's collation, e.g. 'Co-op' finds 'coop', if there is no exact match.
+        Raise KeyError if key is not found.
+        """
+        return self._treat_record_data(self._lookup_record(key, normalize))
 
-    def _decode_record_block(self):
-        f = open(self._fname, 'rb')
-        f.seek(self._record_block_offset)
+    def lookup_many(self, keys, normalize=False):
+        """Return a list of definitions of keys, in the same order,
+        None for keys not found. Each record block needed is read and
+        decompressed only once.
+        """
+        return [None if record is None else self._treat_record_data(record)
+                for record in self._lookup_records(keys, normalize)]
 
-        num_record_blocks = self._read_number(f)
-        num_entries = self._read_number(f)
-        assert(num_entries == self._num_entries)
-        record_block_info_size = self._read_number(f)
-        record_block_size = self._read_number(f)
+    def entry(self, index):
+        """Return (key, value) of the index-th entry in dictionary order.
+        """
+        return self._get_key(index)[1], self._treat_record_data(self._read_record(index))
+
+    def _treat_record_data(self, record):
+        if self._utf8:
+            # valid utf-8 needs no transcoding, only strip the NUL terminator,
+            # invalid bytes are dropped as by the conversion below
+            record = bytes(record)
+            try:
+                record.decode('utf-8')
+            except UnicodeDecodeError:
+                record = record.decode('utf-8', errors='ignore').encode('utf-8')
+            record = record.strip(b'\x00')
+        else:
+            # convert to utf-8
+            record = record.decode(self._encoding, errors='ignore').strip(u'\x00').encode('utf-8')
+        # substitute styles
+        if self._substyle and self._stylesheet:
+            record = self._substitute_stylesheet(record)
+        return record
+
+    def _record_text(self, record):
+        if self._substyle and self._stylesheet:
+            return self._treat_record_data(record).decode('utf-8', errors='ignore')
+        return bytes(record).decode(self._encoding, errors='ignore').strip(u'\x00')
+
+    def _record_decoder(self, decode):
+        """
+        return the function turning a raw record into an item value of
+        items(decode=decode), None for raw records
+        """
+        if decode == 'utf8':
+            return self._treat_record_data
+        elif decode == 'raw':
+            return None
+        elif decode == 'str':
+            return self._record_text
+        elif decode == 'lazy':
+            return partial(LazyRecord, self)
+        raise ValueError("decode must be 'utf8', 'raw', 'str' or 'lazy', not %r" % (decode,))
 
-        # record block info section
-        record_block_info_list = []
-        size_counter = 0
-        for i in range(num_record_blocks):
-            compressed_size = self._read_number(f)
-            decompressed_size = self._read_number(f)
-            record_block_info_list += [(compressed_size, decompressed_size)]
-            size_counter += self._number_width * 2
-        assert(size_counter == record_block_info_size)
+    def _substitute_stylesheet(self, txt):
+        """
+        replace each style marker `number` of utf-8 record txt by the style
+        begin, and close it by the style end before the next marker
+        """
+        # one split, into [text, number, text, number, text, ...]
+        parts = _STYLE_TAG_PATTERN.split(txt)
+        if len(parts) == 1:
+            return txt
+        numbers = parts[1::2]
+        texts = parts[2::2]
+        try:
+            begins = [self._style_begins[number] for number in numbers]
+            ends = [self._style_ends[number] for number in numbers]
+        except KeyError:
+            # unknown style, keep its marker
+            begins = [self._style_begins.get(number, b'`' + number + b'`') for number in numbers]
+            ends = [self._style_ends.get(number, b'') for number in numbers]
+        # text, begin, text, end, begin, text, end, ...
+        styled = [None] * (3 * len(numbers) + 1)
+        styled[0] = parts[0]
+        styled[1::3] = begins
+        styled[2::3] = texts
+        styled[3::3] = ends
+        for i, text in enumerate(texts):
+            if text.endswith(b'\n'):
+                styled[3*i+2] = text.rstrip()
+                styled[3*i+3] = ends[i] + b'\r\n'
+        return b''.join(styled)
+
+    def _decode_record_block(self, workers=0, treat=None):
+        self._load_keys()
+        key_list = self._key_list
+        key_ids = key_list.key_ids
+        num_entries = len(key_ids)
 
         # actual record block data
-        offset = 0
         i = 0
-        size_counter = 0
-        for compressed_size, decompressed_size in record_block_info_list:
-            record_block_compressed = f.read(compressed_size)
-            # 4 bytes indicates block compression type
-            record_block_type = record_block_compressed[:4]
-            # 4 bytes adler checksum of uncompressed content
-            adler32 = unpack('>I', record_block_compressed[4:8])[0]
-            # no compression
-            if record_block_type == b'\x00\x00\x00\x00':
-                record_block = record_block_compressed[8:]
-            # lzo compression
-            elif record_block_type == b'\x01\x00\x00\x00':
-                if lzo is None:
-                    print("LZO compression is not supported")
-                    break
-                # decompress
-                header = b'\xf0' + pack('>I', decompressed_size)
-                record_block = lzo.decompress(header + record_block_compressed[8:])
-            # zlib compression
-            elif record_block_type == b'\x02\x00\x00\x00':
-                # decompress
-                record_block = zlib.decompress(record_block_compressed[8:])
-
-            # notice that adler32 return signed value
-            assert(adler32 == zlib.adler32(record_block) & 0xffffffff)
-
-            assert(len(record_block) == decompressed_size)
+        for offset, record_block in self._iter_record_blocks(workers):
             # split record block according to the offset info from key block
-            while i < len(self._key_list):
-                record_start, key_text = self._key_list[i]
+            while i < num_entries:
+                record_start = key_ids[i]
                 # reach the end of current record block
                 if record_start - offset >= len(record_block):
                     break
                 # record end index
-                if i < len(self._key_list)-1:
-                    record_end = self._key_list[i+1][0]
+                if i < num_entries-1:
+                    record_end = key_ids[i+1]
                 else:
                     record_end = len(record_block) + offset
+                key_text = key_list.key_text(i)
                 i += 1
                 record = record_block[record_start-offset:record_end-offset]
-                # convert to utf-8
-                record = record.decode(self._encoding, errors='ignore').strip(u'\x00').encode('utf-8')
-                # substitute styles
-                if self._substyle and self._stylesheet:
-                    record = self._substitute_stylesheet(record)
-
+                if treat is not None:
+                    record = treat(record)
                 yield key_text, record
-            offset += len(record_block)
-            size_counter += compressed_size
-        assert(size_counter == record_block_size)
-
-        f.close()
 
 
 if __name__ == '__main__':
@@ -603,6 +1805,13 @@ if __name__ == '__main__':
     import os.path
     import argparse
     import codecs
+    import time
+
+    # python readmdict.py serve [options] filename
+    if sys.argv[1:2] == ['serve']:
+        import mdxserver
+        mdxserver.main(sys.argv[2:])
+        sys.exit(0)
 
     def passcode(s):
         try:
@@ -626,6 +1835,10 @@ if __name__ == '__main__':
                         help='folder to extract data files from mdd')
     parser.add_argument('-p', '--passcode', default=None, type=passcode,
                         help='register_code,email_or_deviceid')
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+                        help='number of threads writing data files extracted from mdd')
+    parser.add_argument('--stats', action="store_true",
+                        help='write time per phase and block counts as JSON to stderr')
     parser.add_argument("filename", nargs='?', help="mdx file name")
     args = parser.parse_args()
 
@@ -645,7 +1858,7 @@ if __name__ == '__main__':
 
     # read mdx file
     if ext.lower() == os.path.extsep + 'mdx':
-        mdx = MDX(args.filename, args.encoding, args.substyle, args.passcode)
+        mdx = MDX(args.filename, args.encoding, args.substyle, args.passcode, stats=args.stats or None)
         if type(args.filename) is unicode:
             bfname = args.filename.encode('utf-8')
         else:
@@ -660,7 +1873,7 @@ if __name__ == '__main__':
     # find companion mdd file
     mdd_filename = ''.join([base, os.path.extsep, 'mdd'])
     if os.path.exists(mdd_filename):
-        mdd = MDD(mdd_filename, args.passcode)
+        mdd = MDD(mdd_filename, args.passcode, stats=args.stats or None)
         if type(mdd_filename) is unicode:
             bfname = mdd_filename.encode('utf-8')
         else:
@@ -686,21 +1899,58 @@ if __name__ == '__main__':
                 tf.write(b'</>\r\n')
             tf.close()
             # write out style
-            if mdx.header.get('StyleSheet'):
+            if mdx.header.get(b'StyleSheet'):
                 style_fname = ''.join([base, '_style', os.path.extsep, 'txt'])
                 sf = open(style_fname, 'wb')
-                sf.write(b'\r\n'.join(mdx.header['StyleSheet'].splitlines()))
+                sf.write(b'\r\n'.join(mdx.header[b'StyleSheet'].splitlines()))
                 sf.close()
         # write out optional data files
         if mdd:
             datafolder = os.path.join(os.path.dirname(args.filename), args.datafolder)
-            if not os.path.exists(datafolder):
-                os.makedirs(datafolder)
-            for key, value in mdd.items():
-                fname = key.decode('utf-8').replace('\\', os.path.sep)
-                dfname = datafolder + fname
-                if not os.path.exists(os.path.dirname(dfname)):
-                    os.makedirs(os.path.dirname(dfname))
+
+            def data_filename(key):
+                return datafolder + key.decode('utf-8').replace('\\', os.path.sep)
+
+            def write_data_file(dfname, value):
                 df = open(dfname, 'wb')
                 df.write(value)
                 df.close()
+
+            # create the whole directory tree once
+            for dirname in sorted(set(os.path.dirname(data_filename(key)) for key in mdd.keys())):
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname)
+
+            start_time = time.time()
+            num_files = 0
+            num_bytes = 0
+            if args.jobs > 1 and ThreadPoolExecutor is not None:
+                executor = ThreadPoolExecutor(max_workers=args.jobs)
+                # bound the number of pending writes, hence the memory held by them
+                pending = []
+                for key, value in mdd.items(zero_copy=True):
+                    pending.append(executor.submit(write_data_file, data_filename(key), value))
+                    if len(pending) >= 64 * args.jobs:
+                        pending.pop(0).result()
+                    num_files += 1
+                    num_bytes += len(value)
+                for future in pending:
+                    future.result()
+                executor.shutdown()
+            else:
+                for key, value in mdd.items(zero_copy=True):
+                    write_data_file(data_filename(key), value)
+                    num_files += 1
+                    num_bytes += len(value)
+            elapsed = max(time.time() - start_time, 1e-6)
+            print('  Extracted %d files, %.1f MB in %.2f s (%.1f files/s, %.1f MB/s)' %
+                  (num_files, num_bytes / 1e6, elapsed, num_files / elapsed, num_bytes / 1e6 / elapsed))
+
+    if args.stats:
+        stats = {}
+        if mdx:
+            stats['mdx'] = mdx.stats.as_dict()
+        if mdd:
+            stats['mdd'] = mdd.stats.as_dict()
+        # on stderr, apart from the other output
+        sys.stderr.write(json.dumps(stats, indent=2) + '\n')
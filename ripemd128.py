@@ -14,6 +14,7 @@ Usage:
       
 
 
+import hashlib
 import struct
 
 
@@ -102,7 +103,7 @@ sp = [ 8, 9, 9,11,13,15,15, 5, 7, 7, 8,11,14,14,12, 6,
       15, 5, 8,11,14,14, 6,14, 6, 9,12, 9,12, 5,15, 8]
 
 
-def ripemd128(message):
+def _ripemd128_reference(message):
 	h0 = 0x67452301
 	h1 = 0xefcdab89
 	h2 = 0x98badcfe
@@ -125,6 +126,324 @@ def ripemd128(message):
 	
 	return struct.pack("<LLLL",h0,h1,h2,h3)
 
+# digests from the module docstring and the RIPEMD-128 specification
+_known_answers = [
+	(b"", b"\xcd\xf2\x62\x13\xa1\x50\xdc\x3e\xcb\x61\x0f\x18\xf6\xb3\x8b\x46"),
+	(b"abc", b"\xc1\x4a\x12\x19\x9c\x66\xe4\xba\x84\x63\x6b\x0f\x69\x14\x4c\x77"),
+	(b"The quick brown fox jumps over the lazy dog",
+	 b"\x3f\xa9\xb5\x7f\x05\x3c\x05\x3f\xbe\x27\x35\xb2\x38\x0d\xb5\x96"),
+]
+
+
+_block = struct.Struct("<16L")
+
+
+def _ripemd128_fast(message):
+	"""
+	same as the reference implementation, with the 64 steps of both lines
+	unrolled: f, K, the message word and the rotation of every step are
+	inlined and the A,B,C,D rotation is done by renaming variables
+	"""
+	message = bytes(message)
+	origlen = len(message)
+	message += b"\x80" + b"\x00" * ((55 - origlen) % 64) + struct.pack("<Q", origlen*8)
+	h0, h1, h2, h3 = 0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476
+	M = 0xffffffff
+	unpack = _block.unpack_from
+	for i in range(0, len(message), 64):
+		x0, x1, x2, x3, x4, x5, x6, x7, x8, x9, x10, x11, x12, x13, x14, x15 = unpack(message, i)
+		A, B, C, D = h0, h1, h2, h3
+		Ap, Bp, Cp, Dp = h0, h1, h2, h3
+		T = (A + (B ^ C ^ D) + x0) & M
+		A = (T << 11 | T >> 21) & M
+		T = (Ap + ((Bp & Dp) | (Cp & ~Dp)) + x5 + 0x50a28be6) & M
+		Ap = (T << 8 | T >> 24) & M
+		T = (D + (A ^ B ^ C) + x1) & M
+		D = (T << 14 | T >> 18) & M
+		T = (Dp + ((Ap & Cp) | (Bp & ~Cp)) + x14 + 0x50a28be6) & M
+		Dp = (T << 9 | T >> 23) & M
+		T = (C + (D ^ A ^ B) + x2) & M
+		C = (T << 15 | T >> 17) & M
+		T = (Cp + ((Dp & Bp) | (Ap & ~Bp)) + x7 + 0x50a28be6) & M
+		Cp = (T << 9 | T >> 23) & M
+		T = (B + (C ^ D ^ A) + x3) & M
+		B = (T << 12 | T >> 20) & M
+		T = (Bp + ((Cp & Ap) | (Dp & ~Ap)) + x0 + 0x50a28be6) & M
+		Bp = (T << 11 | T >> 21) & M
+		T = (A + (B ^ C ^ D) + x4) & M
+		A = (T << 5 | T >> 27) & M
+		T = (Ap + ((Bp & Dp) | (Cp & ~Dp)) + x9 + 0x50a28be6) & M
+		Ap = (T << 13 | T >> 19) & M
+		T = (D + (A ^ B ^ C) + x5) & M
+		D = (T << 8 | T >> 24) & M
+		T = (Dp + ((Ap & Cp) | (Bp & ~Cp)) + x2 + 0x50a28be6) & M
+		Dp = (T << 15 | T >> 17) & M
+		T = (C + (D ^ A ^ B) + x6) & M
+		C = (T << 7 | T >> 25) & M
+		T = (Cp + ((Dp & Bp) | (Ap & ~Bp)) + x11 + 0x50a28be6) & M
+		Cp = (T << 15 | T >> 17) & M
+		T = (B + (C ^ D ^ A) + x7) & M
+		B = (T << 9 | T >> 23) & M
+		T = (Bp + ((Cp & Ap) | (Dp & ~Ap)) + x4 + 0x50a28be6) & M
+		Bp = (T << 5 | T >> 27) & M
+		T = (A + (B ^ C ^ D) + x8) & M
+		A = (T << 11 | T >> 21) & M
+		T = (Ap + ((Bp & Dp) | (Cp & ~Dp)) + x13 + 0x50a28be6) & M
+		Ap = (T << 7 | T >> 25) & M
+		T = (D + (A ^ B ^ C) + x9) & M
+		D = (T << 13 | T >> 19) & M
+		T = (Dp + ((Ap & Cp) | (Bp & ~Cp)) + x6 + 0x50a28be6) & M
+		Dp = (T << 7 | T >> 25) & M
+		T = (C + (D ^ A ^ B) + x10) & M
+		C = (T << 14 | T >> 18) & M
+		T = (Cp + ((Dp & Bp) | (Ap & ~Bp)) + x15 + 0x50a28be6) & M
+		Cp = (T << 8 | T >> 24) & M
+		T = (B + (C ^ D ^ A) + x11) & M
+		B = (T << 15 | T >> 17) & M
+		T = (Bp + ((Cp & Ap) | (Dp & ~Ap)) + x8 + 0x50a28be6) & M
+		Bp = (T << 11 | T >> 21) & M
+		T = (A + (B ^ C ^ D) + x12) & M
+		A = (T << 6 | T >> 26) & M
+		T = (Ap + ((Bp & Dp) | (Cp & ~Dp)) + x1 + 0x50a28be6) & M
+		Ap = (T << 14 | T >> 18) & M
+		T = (D + (A ^ B ^ C) + x13) & M
+		D = (T << 7 | T >> 25) & M
+		T = (Dp + ((Ap & Cp) | (Bp & ~Cp)) + x10 + 0x50a28be6) & M
+		Dp = (T << 14 | T >> 18) & M
+		T = (C + (D ^ A ^ B) + x14) & M
+		C = (T << 9 | T >> 23) & M
+		T = (Cp + ((Dp & Bp) | (Ap & ~Bp)) + x3 + 0x50a28be6) & M
+		Cp = (T << 12 | T >> 20) & M
+		T = (B + (C ^ D ^ A) + x15) & M
+		B = (T << 8 | T >> 24) & M
+		T = (Bp + ((Cp & Ap) | (Dp & ~Ap)) + x12 + 0x50a28be6) & M
+		Bp = (T << 6 | T >> 26) & M
+		T = (A + ((B & C) | (D & ~B)) + x7 + 0x5a827999) & M
+		A = (T << 7 | T >> 25) & M
+		T = (Ap + ((Bp | (M & ~Cp)) ^ Dp) + x6 + 0x5c4dd124) & M
+		Ap = (T << 9 | T >> 23) & M
+		T = (D + ((A & B) | (C & ~A)) + x4 + 0x5a827999) & M
+		D = (T << 6 | T >> 26) & M
+		T = (Dp + ((Ap | (M & ~Bp)) ^ Cp) + x11 + 0x5c4dd124) & M
+		Dp = (T << 13 | T >> 19) & M
+		T = (C + ((D & A) | (B & ~D)) + x13 + 0x5a827999) & M
+		C = (T << 8 | T >> 24) & M
+		T = (Cp + ((Dp | (M & ~Ap)) ^ Bp) + x3 + 0x5c4dd124) & M
+		Cp = (T << 15 | T >> 17) & M
+		T = (B + ((C & D) | (A & ~C)) + x1 + 0x5a827999) & M
+		B = (T << 13 | T >> 19) & M
+		T = (Bp + ((Cp | (M & ~Dp)) ^ Ap) + x7 + 0x5c4dd124) & M
+		Bp = (T << 7 | T >> 25) & M
+		T = (A + ((B & C) | (D & ~B)) + x10 + 0x5a827999) & M
+		A = (T << 11 | T >> 21) & M
+		T = (Ap + ((Bp | (M & ~Cp)) ^ Dp) + x0 + 0x5c4dd124) & M
+		Ap = (T << 12 | T >> 20) & M
+		T = (D + ((A & B) | (C & ~A)) + x6 + 0x5a827999) & M
+		D = (T << 9 | T >> 23) & M
+		T = (Dp + ((Ap | (M & ~Bp)) ^ Cp) + x13 + 0x5c4dd124) & M
+		Dp = (T << 8 | T >> 24) & M
+		T = (C + ((D & A) | (B & ~D)) + x15 + 0x5a827999) & M
+		C = (T << 7 | T >> 25) & M
+		T = (Cp + ((Dp | (M & ~Ap)) ^ Bp) + x5 + 0x5c4dd124) & M
+		Cp = (T << 9 | T >> 23) & M
+		T = (B + ((C & D) | (A & ~C)) + x3 + 0x5a827999) & M
+		B = (T << 15 | T >> 17) & M
+		T = (Bp + ((Cp | (M & ~Dp)) ^ Ap) + x10 + 0x5c4dd124) & M
+		Bp = (T << 11 | T >> 21) & M
+		T = (A + ((B & C) | (D & ~B)) + x12 + 0x5a827999) & M
+		A = (T << 7 | T >> 25) & M
+		T = (Ap + ((Bp | (M & ~Cp)) ^ Dp) + x14 + 0x5c4dd124) & M
+		Ap = (T << 7 | T >> 25) & M
+		T = (D + ((A & B) | (C & ~A)) + x0 + 0x5a827999) & M
+		D = (T << 12 | T >> 20) & M
+		T = (Dp + ((Ap | (M & ~Bp)) ^ Cp) + x15 + 0x5c4dd124) & M
+		Dp = (T << 7 | T >> 25) & M
+		T = (C + ((D & A) | (B & ~D)) + x9 + 0x5a827999) & M
+		C = (T << 15 | T >> 17) & M
+		T = (Cp + ((Dp | (M & ~Ap)) ^ Bp) + x8 + 0x5c4dd124) & M
+		Cp = (T << 12 | T >> 20) & M
+		T = (B + ((C & D) | (A & ~C)) + x5 + 0x5a827999) & M
+		B = (T << 9 | T >> 23) & M
+		T = (Bp + ((Cp | (M & ~Dp)) ^ Ap) + x12 + 0x5c4dd124) & M
+		Bp = (T << 7 | T >> 25) & M
+		T = (A + ((B & C) | (D & ~B)) + x2 + 0x5a827999) & M
+		A = (T << 11 | T >> 21) & M
+		T = (Ap + ((Bp | (M & ~Cp)) ^ Dp) + x4 + 0x5c4dd124) & M
+		Ap = (T << 6 | T >> 26) & M
+		T = (D + ((A & B) | (C & ~A)) + x14 + 0x5a827999) & M
+		D = (T << 7 | T >> 25) & M
+		T = (Dp + ((Ap | (M & ~Bp)) ^ Cp) + x9 + 0x5c4dd124) & M
+		Dp = (T << 15 | T >> 17) & M
+		T = (C + ((D & A) | (B & ~D)) + x11 + 0x5a827999) & M
+		C = (T << 13 | T >> 19) & M
+		T = (Cp + ((Dp | (M & ~Ap)) ^ Bp) + x1 + 0x5c4dd124) & M
+		Cp = (T << 13 | T >> 19) & M
+		T = (B + ((C & D) | (A & ~C)) + x8 + 0x5a827999) & M
+		B = (T << 12 | T >> 20) & M
+		T = (Bp + ((Cp | (M & ~Dp)) ^ Ap) + x2 + 0x5c4dd124) & M
+		Bp = (T << 11 | T >> 21) & M
+		T = (A + ((B | (M & ~C)) ^ D) + x3 + 0x6ed9eba1) & M
+		A = (T << 11 | T >> 21) & M
+		T = (Ap + ((Bp & Cp) | (Dp & ~Bp)) + x15 + 0x6d703ef3) & M
+		Ap = (T << 9 | T >> 23) & M
+		T = (D + ((A | (M & ~B)) ^ C) + x10 + 0x6ed9eba1) & M
+		D = (T << 13 | T >> 19) & M
+		T = (Dp + ((Ap & Bp) | (Cp & ~Ap)) + x5 + 0x6d703ef3) & M
+		Dp = (T << 7 | T >> 25) & M
+		T = (C + ((D | (M & ~A)) ^ B) + x14 + 0x6ed9eba1) & M
+		C = (T << 6 | T >> 26) & M
+		T = (Cp + ((Dp & Ap) | (Bp & ~Dp)) + x1 + 0x6d703ef3) & M
+		Cp = (T << 15 | T >> 17) & M
+		T = (B + ((C | (M & ~D)) ^ A) + x4 + 0x6ed9eba1) & M
+		B = (T << 7 | T >> 25) & M
+		T = (Bp + ((Cp & Dp) | (Ap & ~Cp)) + x3 + 0x6d703ef3) & M
+		Bp = (T << 11 | T >> 21) & M
+		T = (A + ((B | (M & ~C)) ^ D) + x9 + 0x6ed9eba1) & M
+		A = (T << 14 | T >> 18) & M
+		T = (Ap + ((Bp & Cp) | (Dp & ~Bp)) + x7 + 0x6d703ef3) & M
+		Ap = (T << 8 | T >> 24) & M
+		T = (D + ((A | (M & ~B)) ^ C) + x15 + 0x6ed9eba1) & M
+		D = (T << 9 | T >> 23) & M
+		T = (Dp + ((Ap & Bp) | (Cp & ~Ap)) + x14 + 0x6d703ef3) & M
+		Dp = (T << 6 | T >> 26) & M
+		T = (C + ((D | (M & ~A)) ^ B) + x8 + 0x6ed9eba1) & M
+		C = (T << 13 | T >> 19) & M
+		T = (Cp + ((Dp & Ap) | (Bp & ~Dp)) + x6 + 0x6d703ef3) & M
+		Cp = (T << 6 | T >> 26) & M
+		T = (B + ((C | (M & ~D)) ^ A) + x1 + 0x6ed9eba1) & M
+		B = (T << 15 | T >> 17) & M
+		T = (Bp + ((Cp & Dp) | (Ap & ~Cp)) + x9 + 0x6d703ef3) & M
+		Bp = (T << 14 | T >> 18) & M
+		T = (A + ((B | (M & ~C)) ^ D) + x2 + 0x6ed9eba1) & M
+		A = (T << 14 | T >> 18) & M
+		T = (Ap + ((Bp & Cp) | (Dp & ~Bp)) + x11 + 0x6d703ef3) & M
+		Ap = (T << 12 | T >> 20) & M
+		T = (D + ((A | (M & ~B)) ^ C) + x7 + 0x6ed9eba1) & M
+		D = (T << 8 | T >> 24) & M
+		T = (Dp + ((Ap & Bp) | (Cp & ~Ap)) + x8 + 0x6d703ef3) & M
+		Dp = (T << 13 | T >> 19) & M
+		T = (C + ((D | (M & ~A)) ^ B) + x0 + 0x6ed9eba1) & M
+		C = (T << 13 | T >> 19) & M
+		T = (Cp + ((Dp & Ap) | (Bp & ~Dp)) + x12 + 0x6d703ef3) & M
+		Cp = (T << 5 | T >> 27) & M
+		T = (B + ((C | (M & ~D)) ^ A) + x6 + 0x6ed9eba1) & M
+		B = (T << 6 | T >> 26) & M
+		T = (Bp + ((Cp & Dp) | (Ap & ~Cp)) + x2 + 0x6d703ef3) & M
+		Bp = (T << 14 | T >> 18) & M
+		T = (A + ((B | (M & ~C)) ^ D) + x13 + 0x6ed9eba1) & M
+		A = (T << 5 | T >> 27) & M
+		T = (Ap + ((Bp & Cp) | (Dp & ~Bp)) + x10 + 0x6d703ef3) & M
+		Ap = (T << 13 | T >> 19) & M
+		T = (D + ((A | (M & ~B)) ^ C) + x11 + 0x6ed9eba1) & M
+		D = (T << 12 | T >> 20) & M
+		T = (Dp + ((Ap & Bp) | (Cp & ~Ap)) + x0 + 0x6d703ef3) & M
+		Dp = (T << 13 | T >> 19) & M
+		T = (C + ((D | (M & ~A)) ^ B) + x5 + 0x6ed9eba1) & M
+		C = (T << 7 | T >> 25) & M
+		T = (Cp + ((Dp & Ap) | (Bp & ~Dp)) + x4 + 0x6d703ef3) & M
+		Cp = (T << 7 | T >> 25) & M
+		T = (B + ((C | (M & ~D)) ^ A) + x12 + 0x6ed9eba1) & M
+		B = (T << 5 | T >> 27) & M
+		T = (Bp + ((Cp & Dp) | (Ap & ~Cp)) + x13 + 0x6d703ef3) & M
+		Bp = (T << 5 | T >> 27) & M
+		T = (A + ((B & D) | (C & ~D)) + x1 + 0x8f1bbcdc) & M
+		A = (T << 11 | T >> 21) & M
+		T = (Ap + (Bp ^ Cp ^ Dp) + x8) & M
+		Ap = (T << 15 | T >> 17) & M
+		T = (D + ((A & C) | (B & ~C)) + x9 + 0x8f1bbcdc) & M
+		D = (T << 12 | T >> 20) & M
+		T = (Dp + (Ap ^ Bp ^ Cp) + x6) & M
+		Dp = (T << 5 | T >> 27) & M
+		T = (C + ((D & B) | (A & ~B)) + x11 + 0x8f1bbcdc) & M
+		C = (T << 14 | T >> 18) & M
+		T = (Cp + (Dp ^ Ap ^ Bp) + x4) & M
+		Cp = (T << 8 | T >> 24) & M
+		T = (B + ((C & A) | (D & ~A)) + x10 + 0x8f1bbcdc) & M
+		B = (T << 15 | T >> 17) & M
+		T = (Bp + (Cp ^ Dp ^ Ap) + x1) & M
+		Bp = (T << 11 | T >> 21) & M
+		T = (A + ((B & D) | (C & ~D)) + x0 + 0x8f1bbcdc) & M
+		A = (T << 14 | T >> 18) & M
+		T = (Ap + (Bp ^ Cp ^ Dp) + x3) & M
+		Ap = (T << 14 | T >> 18) & M
+		T = (D + ((A & C) | (B & ~C)) + x8 + 0x8f1bbcdc) & M
+		D = (T << 15 | T >> 17) & M
+		T = (Dp + (Ap ^ Bp ^ Cp) + x11) & M
+		Dp = (T << 14 | T >> 18) & M
+		T = (C + ((D & B) | (A & ~B)) + x12 + 0x8f1bbcdc) & M
+		C = (T << 9 | T >> 23) & M
+		T = (Cp + (Dp ^ Ap ^ Bp) + x15) & M
+		Cp = (T << 6 | T >> 26) & M
+		T = (B + ((C & A) | (D & ~A)) + x4 + 0x8f1bbcdc) & M
+		B = (T << 8 | T >> 24) & M
+		T = (Bp + (Cp ^ Dp ^ Ap) + x0) & M
+		Bp = (T << 14 | T >> 18) & M
+		T = (A + ((B & D) | (C & ~D)) + x13 + 0x8f1bbcdc) & M
+		A = (T << 9 | T >> 23) & M
+		T = (Ap + (Bp ^ Cp ^ Dp) + x5) & M
+		Ap = (T << 6 | T >> 26) & M
+		T = (D + ((A & C) | (B & ~C)) + x3 + 0x8f1bbcdc) & M
+		D = (T << 14 | T >> 18) & M
+		T = (Dp + (Ap ^ Bp ^ Cp) + x12) & M
+		Dp = (T << 9 | T >> 23) & M
+		T = (C + ((D & B) | (A & ~B)) + x7 + 0x8f1bbcdc) & M
+		C = (T << 5 | T >> 27) & M
+		T = (Cp + (Dp ^ Ap ^ Bp) + x2) & M
+		Cp = (T << 12 | T >> 20) & M
+		T = (B + ((C & A) | (D & ~A)) + x15 + 0x8f1bbcdc) & M
+		B = (T << 6 | T >> 26) & M
+		T = (Bp + (Cp ^ Dp ^ Ap) + x13) & M
+		Bp = (T << 9 | T >> 23) & M
+		T = (A + ((B & D) | (C & ~D)) + x14 + 0x8f1bbcdc) & M
+		A = (T << 8 | T >> 24) & M
+		T = (Ap + (Bp ^ Cp ^ Dp) + x9) & M
+		Ap = (T << 12 | T >> 20) & M
+		T = (D + ((A & C) | (B & ~C)) + x5 + 0x8f1bbcdc) & M
+		D = (T << 6 | T >> 26) & M
+		T = (Dp + (Ap ^ Bp ^ Cp) + x7) & M
+		Dp = (T << 5 | T >> 27) & M
+		T = (C + ((D & B) | (A & ~B)) + x6 + 0x8f1bbcdc) & M
+		C = (T << 5 | T >> 27) & M
+		T = (Cp + (Dp ^ Ap ^ Bp) + x10) & M
+		Cp = (T << 15 | T >> 17) & M
+		T = (B + ((C & A) | (D & ~A)) + x2 + 0x8f1bbcdc) & M
+		B = (T << 12 | T >> 20) & M
+		T = (Bp + (Cp ^ Dp ^ Ap) + x14) & M
+		Bp = (T << 8 | T >> 24) & M
+		h0, h1, h2, h3 = (h1 + C + Dp) & M, (h2 + D + Ap) & M, (h3 + A + Bp) & M, (h0 + B + Cp) & M
+	return struct.pack("<LLLL", h0, h1, h2, h3)
+
+
+def _hashlib_ripemd128():
+	"""
+	return a ripemd128 function backed by hashlib (OpenSSL) if this build
+	provides one that passes the known answer tests, None otherwise
+	"""
+	try:
+		hashlib.new("ripemd128")
+	except ValueError:
+		return None
+
+	def ripemd128(message):
+		return hashlib.new("ripemd128", bytes(message)).digest()
+
+	if not _passes_known_answers(ripemd128):
+		return None
+	return ripemd128
+
+
+def _passes_known_answers(ripemd128):
+	for message, digest in _known_answers:
+		if ripemd128(message) != digest:
+			return False
+	return True
+
+
+# the unrolled version is checked too, the reference one is the fallback
+ripemd128 = _hashlib_ripemd128() or \
+	(_ripemd128_fast if _passes_known_answers(_ripemd128_fast) else _ripemd128_reference)
+
+
 def hexstr(bstr):
 	return "".join("{0:02x}".format(b) for b in bstr)
 	